@@ -7,10 +7,13 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-from src.ingest import process_uploaded_file, process_local_file
 from src.rag import RAGPipeline
-from src.vector_store import VectorStoreManager
-from src.config import MODELS_DIR, MODEL_NAME, DATA_DIR
+from src.conversation import ConversationState
+from src.streaming import CancelToken, StreamWorker
+from src.snapshot import compact, export_snapshot, import_snapshot
+from src.workspaces import get_registry, validate_workspace_name
+from src.resources import get_governor
+from src.config import MODELS_DIR, MODEL_NAME, DATA_DIR, SNAPSHOT_DIR, COLLECTION_NAME, EMBEDDING_MODELS
 
 # Page Config
 st.set_page_config(
@@ -20,20 +23,67 @@ st.set_page_config(
 )
 
 # Initialize Session State
-# Initialize vector store first
-if "vector_store" not in st.session_state:
-    st.session_state.vector_store = VectorStoreManager()
+# Each workspace (tenant) has its own collection; the registry is shared by all sessions
+registry = get_registry()
+if "workspace" not in st.session_state:
+    st.session_state.workspace = COLLECTION_NAME
+
+# Re-open on every run: a dict lookup when already open, and it keeps active workspaces from being closed
+st.session_state.vector_store = registry.open(st.session_state.workspace)
 
 # Initialize RAG pipeline with the same vector store instance
 if "rag_pipeline" not in st.session_state:
-    st.session_state.rag_pipeline = RAGPipeline()
-    # Share the same vector store
+    st.session_state.rag_pipeline = RAGPipeline(
+        vector_store=st.session_state.vector_store,
+        llm_slots=registry.llm_slots(st.session_state.workspace)
+    )
+else:
     st.session_state.rag_pipeline.vector_store = st.session_state.vector_store
+    st.session_state.rag_pipeline.llm_slots = registry.llm_slots(st.session_state.workspace)
 
 # Track files uploaded in this session
 if "uploaded_files_this_session" not in st.session_state:
     st.session_state.uploaded_files_this_session = []
 
+def switch_workspace(name: str):
+    """Switches this session to another workspace and drops state tied to the old one."""
+    st.session_state.workspace = name
+    st.session_state.uploaded_files_this_session = []
+    st.session_state.messages = []
+    if "conversation" in st.session_state:
+        st.session_state.conversation.clear()
+
+def ingest_progress(progress_bar, index: int, total: int):
+    """Returns an ingest on_progress callback that drives the overall progress bar with live RSS/CPU."""
+    def update(state):
+        fraction = state["pages"] / state["page_count"] if state["page_count"] else 0.0
+        rss = f"{state['rss_mb']:.0f} MB" if state["rss_mb"] is not None else "n/a"
+        progress_bar.progress(
+            min((index + fraction) / total, 1.0),
+            text=f"{state['filename']}: {state['stage']} · page {state['pages']}/{state['page_count'] or '?'} · "
+                 f"{state['chunks']} chunks · RSS {rss} · CPU {state['cpu_percent']:.0f}%"
+        )
+    return update
+
+def report_ingest(report):
+    """Shows the outcome of one governed ingest."""
+    filename = report["filename"]
+    if report["truncated"]:
+        st.warning(
+            f"⚠️ {filename}: Partially ingested {report['chunks']} chunks from {report['pages']}/{report['page_count']} pages "
+            f"({report['truncated']})"
+        )
+    elif report["chunks"]:
+        st.success(f"✅ {filename}: Added {report['chunks']} chunks to database ({report['seconds']:.1f}s, peak RSS {report['peak_rss_mb']:.0f} MB)")
+    else:
+        st.error(f"❌ {filename}: No text extracted (empty file or OCR failed)")
+
+def stop_generation():
+    """Stop button callback: cancels the running stream, which closes the upstream request."""
+    worker = st.session_state.get("active_stream")
+    if worker is not None:
+        worker.cancel()
+
 # Sidebar
 st.sidebar.title("📚 Research RAG")
 st.sidebar.markdown("---")
@@ -46,6 +96,31 @@ if not os.getenv("GROQ_API_KEY"):
 else:
     st.sidebar.success("✅ Groq API Key loaded")
 
+# Warm the LLM connection at session start so the first answer doesn't pay for it
+if os.getenv("GROQ_API_KEY"):
+    st.session_state.rag_pipeline.llm_engine.warm_up(api_key=os.getenv("GROQ_API_KEY"))
+
+ttft = st.session_state.rag_pipeline.metrics.summary("ttft_seconds")
+if ttft["count"]:
+    st.sidebar.caption(f"⏱️ Time to first token: {ttft['last'] * 1000:.0f} ms (avg {ttft['mean'] * 1000:.0f} ms over {ttft['count']} answers)")
+
+st.sidebar.markdown("---")
+
+# Workspace selection
+workspaces = registry.list_workspaces()
+if st.session_state.workspace not in workspaces:
+    workspaces.append(st.session_state.workspace)
+selected_workspace = st.sidebar.selectbox("Workspace", workspaces, index=workspaces.index(st.session_state.workspace))
+new_workspace = st.sidebar.text_input("New workspace", placeholder="e.g. team-nlp")
+if st.sidebar.button("➕ Create workspace") and new_workspace:
+    try:
+        selected_workspace = validate_workspace_name(new_workspace)
+    except ValueError as e:
+        st.sidebar.error(str(e))
+if selected_workspace != st.session_state.workspace:
+    switch_workspace(selected_workspace)
+    st.rerun()
+
 st.sidebar.markdown("---")
 
 # Model Status Check (Skipped for Groq)
@@ -93,29 +168,25 @@ if nav == "Upload Documents":
                 processed_count = 0
                 
                 for file in uploaded_files:
+                    filename = file.name
                     try:
-                        print(f"\n--- Processing file: {file.name} ---")
-                        status_text.text(f"Processing {file.name}...")
+                        print(f"\n--- Processing file: {filename} ---")
+                        status_text.text(f"Processing {filename}...")
                         
-                        filename, text = process_uploaded_file(file)
-                        print(f"Filename: {filename}")
-                        print(f"Text length: {len(text) if text else 0}")
+                        # Pages are extracted and indexed in bounded batches under the shared ingest limits
+                        report = get_governor().ingest(
+                            st.session_state.vector_store, file, filename,
+                            on_progress=ingest_progress(progress_bar, processed_count, total_files)
+                        )
+                        print(f"Chunks added: {report['chunks']}")
                         
-                        if text:
-                            st.info(f"Extracted {len(text)} characters from {filename}")
-                            print(f"Adding to vector store...")
-                            
-                            chunks_added = st.session_state.vector_store.add_document(filename, text)
-                            print(f"Chunks added: {chunks_added}")
-                            
-                            # Track this file as uploaded in this session
-                            if filename not in st.session_state.uploaded_files_this_session:
-                                st.session_state.uploaded_files_this_session.append(filename)
-                            
-                            st.success(f"✅ {filename}: Added {chunks_added} chunks to database")
-                        else:
-                            print(f"ERROR: No text extracted from {filename}")
-                            st.error(f"❌ {filename}: No text extracted (empty file or OCR failed)")
+                        # Track this file as uploaded in this session
+                        if report["chunks"] and filename not in st.session_state.uploaded_files_this_session:
+                            st.session_state.uploaded_files_this_session.append(filename)
+                        
+                        report_ingest(report)
+                    except ValueError as e:
+                        st.error(f"❌ {filename}: {e}")
                     except Exception as e:
                         print(f"EXCEPTION: {str(e)}")
                         st.error(f"❌ {filename}: Error - {str(e)}")
@@ -158,13 +229,17 @@ if nav == "Upload Documents":
                 for f in local_files:
                     status_text.text(f"Processing {f}...")
                     file_path = os.path.join(DATA_DIR, f)
-                    filename, text = process_local_file(file_path)
                     
-                    if text:
-                        chunks_added = st.session_state.vector_store.add_document(filename, text)
-                        st.success(f"✅ {filename}: Added {chunks_added} chunks.")
-                    else:
-                        st.error(f"❌ {filename}: Failed to extract text.")
+                    try:
+                        report = get_governor().ingest(
+                            st.session_state.vector_store, file_path, f,
+                            on_progress=ingest_progress(progress_bar, processed_count, len(local_files))
+                        )
+                        report_ingest(report)
+                    except ValueError as e:
+                        st.error(f"❌ {f}: {e}")
+                    except Exception as e:
+                        st.error(f"❌ {f}: Failed to extract text ({e})")
                         
                     processed_count += 1
                     progress_bar.progress(processed_count / len(local_files))
@@ -182,6 +257,19 @@ elif nav == "Chat & Query":
     if "messages" not in st.session_state:
         st.session_state.messages = []
 
+    # Conversation state used for follow-up rewriting and context reuse
+    if "conversation" not in st.session_state:
+        st.session_state.conversation = ConversationState()
+
+    # Keep the partial answer of a generation that was stopped or interrupted by a rerun
+    worker = st.session_state.get("active_stream")
+    if worker is not None:
+        worker.cancel()
+        partial = worker.text() + "\n\n[Generation stopped]"
+        st.session_state.messages.append({"role": "assistant", "content": partial})
+        st.session_state.conversation.record_answer(partial)
+        st.session_state.active_stream = None
+
     # Display chat messages
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
@@ -209,114 +297,74 @@ elif nav == "Chat & Query":
 
         # Generate response
         with st.chat_message("assistant"):
-            # Initialize stop flag
-            if "stop_generation" not in st.session_state:
-                st.session_state.stop_generation = False
-            
             # Create columns for stop button
             col_response, col_stop = st.columns([10, 1])
             
             with col_stop:
-                if st.button("⏹️", key=f"stop_{len(st.session_state.messages)}", help="Stop generation"):
-                    st.session_state.stop_generation = True
+                st.button("⏹️", key=f"stop_{len(st.session_state.messages)}", help="Stop generation", on_click=stop_generation)
             
-            if st.session_state.stop_generation:
-                st.warning("⏹️ Generation stopped by user")
-                answer = "[Stopped by user]"
-                st.session_state.stop_generation = False
-            else:
-                with col_response:
-                    try:
-                        print(f"\n{'='*50}")
-                        print(f"QUERY: {prompt}")
-                        print(f"Vector store instance: {id(st.session_state.rag_pipeline.vector_store)}")
-                        print(f"Session vector store instance: {id(st.session_state.vector_store)}")
-                        print(f"Session uploaded files: {st.session_state.uploaded_files_this_session}")
-                        
-                        # Use source filter if files were uploaded this session
-                        source_filter = st.session_state.uploaded_files_this_session if st.session_state.uploaded_files_this_session else None
-                        
-                        # Use streaming method with filter
-                        stream, sources = st.session_state.rag_pipeline.answer_question_stream(
-                            prompt, 
-                            source_filter=source_filter,
-                            k=10  # Increase context window
-                        )
-                        
-                        print(f"Sources found: {sources}")
-                        print(f"{'='*50}\n")
-                        
-                        # Display sources first
-                        if sources:
-                            st.info(f"📚 Sources: {', '.join(sources)}")
-                        else:
-                            st.warning("No specific sources found.")
+            with col_response:
+                try:
+                    print(f"\n{'='*50}")
+                    print(f"QUERY: {prompt}")
+                    print(f"Session uploaded files: {st.session_state.uploaded_files_this_session}")
+                    
+                    # Use source filter if files were uploaded this session
+                    source_filter = st.session_state.uploaded_files_this_session if st.session_state.uploaded_files_this_session else None
+                    
+                    # Use streaming method with filter; the token lets the stop button abort the upstream request
+                    cancel_token = CancelToken()
+                    stream, sources = st.session_state.rag_pipeline.answer_question_stream(
+                        prompt, 
+                        source_filter=source_filter,
+                        k=10,  # Increase context window
+                        conversation=st.session_state.conversation,
+                        cancel_token=cancel_token
+                    )
+                    
+                    print(f"Sources found: {sources}")
+                    
+                    # Display sources first
+                    if sources:
+                        st.info(f"📚 Sources: {', '.join(sources)}")
+                    else:
+                        st.warning("No specific sources found.")
 
-                        # Stream the response
-                        placeholder = st.empty()
-                        full_response = ""
-                        
-                        print(f"\n[{datetime.now().strftime('%H:%M:%S')}][LLM] Starting generation...")
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}][LLM] Prompt length: {len(prompt)} characters")
-                        
-                        # Iterate over the stream with stop check
-                        token_count = 0
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}][LLM] Entering stream loop...")
-                        
-                        for i, chunk in enumerate(stream):
-                            if i == 0:
-                                print(f"[{datetime.now().strftime('%H:%M:%S')}][LLM] First chunk received: {type(chunk)}")
-                            
-                            # Check stop flag
-                            if st.session_state.stop_generation:
-                                st.session_state.stop_generation = False
-                                full_response += "\n\n[Generation stopped]"
-                                print(f"[{datetime.now().strftime('%H:%M:%S')}][LLM] Generation stopped by user after {token_count} tokens")
-                                break
-                            
-                            # Handle Groq chunk format
-                            text_chunk = ""
-                            try:
-                                if hasattr(chunk, 'choices') and len(chunk.choices) > 0:
-                                    delta = chunk.choices[0].delta
-                                    if delta.content:
-                                        text_chunk = delta.content
-                                # Fallback for dictionary format
-                                elif isinstance(chunk, dict) and 'choices' in chunk:
-                                    if 'delta' in chunk['choices'][0] and 'content' in chunk['choices'][0]['delta']:
-                                        text_chunk = chunk['choices'][0]['delta']['content']
-                            except Exception as e:
-                                print(f"Error parsing chunk: {e}")
-                                    
-                            if text_chunk:
-                                full_response += text_chunk
-                                placeholder.markdown(full_response + "▌")
-                                token_count += 1
-                                
-                                # Log progress every 20 tokens
-                                if token_count % 20 == 0:
-                                    print(f"[{datetime.now().strftime('%H:%M:%S')}][LLM] Generated {token_count} tokens...")
-                        
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}][LLM] Generation complete!")
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}][LLM] Generated {token_count} tokens")
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}][LLM] Response length: {len(full_response)} characters")
-                        print(f"{'='*50}\n")
-                                
-                        placeholder.markdown(full_response)
-                        answer = full_response
-                        
-                    except Exception as e:
-                        st.error(f"An error occurred: {e}")
-                        answer = f"Error: {e}"
+                    # Stream the response on a background thread; the stop button cancels it
+                    placeholder = st.empty()
+                    worker = StreamWorker(stream, cancel_token)
+                    st.session_state.active_stream = worker
+                    try:
+                        answer = worker.render(placeholder)
+                    finally:
+                        # If this run is interrupted (stop button, navigation), abort the upstream request
+                        worker.cancel()
+                    st.session_state.active_stream = None
+                    
+                    if worker.error:
+                        st.error(f"An error occurred: {worker.error}")
+                    print(f"[LLM] Generated {worker.token_count} tokens, {len(answer)} characters in {worker.finished - worker.started:.2f}s")
+                    print(f"{'='*50}\n")
+                    
+                except Exception as e:
+                    st.error(f"An error occurred: {e}")
+                    answer = f"Error: {e}"
         
         # Add assistant message to history
         st.session_state.messages.append({"role": "assistant", "content": answer})
+        st.session_state.conversation.record_answer(answer)
 
 # --- Manage Page ---
 elif nav == "Manage Knowledge Base":
     st.header("🗂️ Manage Knowledge Base")
     
-    docs = st.session_state.vector_store.list_documents()
+    vector_store = st.session_state.vector_store
+    st.caption(
+        f"Workspace `{st.session_state.workspace}`: {len(vector_store.chunk_store)} / {vector_store.max_chunks or '∞'} chunks · "
+        f"{len(registry.open_workspaces())} workspace(s) open in memory"
+    )
+    
+    docs = vector_store.list_documents()
     
     st.subheader(f"Stored Documents ({len(docs)})")
     if docs:
@@ -325,10 +373,90 @@ elif nav == "Manage Knowledge Base":
     else:
         st.info("No documents found in the database.")
         
+    st.markdown("---")
+    st.subheader("Embedding Model")
+    st.caption(f"Queries use `{vector_store.embedding_model_name}`.")
+    
+    job = vector_store.reindex_job
+    progress = job.progress() if job is not None else None
+    if progress and progress["running"]:
+        eta = f"{progress['eta_seconds']:.0f}s" if progress["eta_seconds"] is not None else "estimating..."
+        st.progress(
+            min(progress["fraction"], 1.0),
+            text=f"Re-indexing with `{progress['model']}`: {progress['done']} / {progress['total']} chunks · "
+                 f"{progress['chunks_per_second']:.1f} chunks/s · ETA {eta}"
+        )
+        if progress["shadow_agreement"] is not None:
+            st.caption(
+                f"Shadow reads: the new index returns {progress['shadow_agreement']:.0%} of the current index's hits "
+                f"(over {progress['shadow_reads']} queries)"
+            )
+        col_refresh, col_cancel = st.columns(2)
+        with col_refresh:
+            if st.button("🔄 Refresh Progress"):
+                st.rerun()
+        with col_cancel:
+            if st.button("⏹️ Cancel Re-index"):
+                vector_store.cancel_reindex()
+                st.rerun()
+    else:
+        if progress and progress["cut_over"]:
+            st.success(f"Switched to `{progress['model']}` after {progress['elapsed_seconds']:.0f}s")
+        elif progress and progress["error"]:
+            st.error(f"Re-index with `{progress['model']}` failed: {progress['error']}")
+        choices = [m for m in EMBEDDING_MODELS if m != vector_store.embedding_model_name]
+        new_model = st.selectbox("New embedding model", choices) if choices else None
+        st.caption("Stored chunk texts are re-embedded in the background; queries keep using the current model until it finishes.")
+        if st.button("🔁 Re-index with this Model", disabled=not choices) and new_model:
+            try:
+                with st.spinner("Loading model..."):
+                    vector_store.start_reindex(new_model)
+            except Exception as e:
+                st.error(f"Could not start re-index: {e}")
+            else:
+                st.rerun()
+    
+    st.markdown("---")
+    st.subheader("Snapshots & Maintenance")
+    
+    col_compact, col_export = st.columns(2)
+    with col_compact:
+        st.markdown("Rewrite the store without space left behind by deletes and re-uploads.")
+        if st.button("🧹 Compact Database"):
+            try:
+                with st.spinner("Compacting..."):
+                    result = compact(st.session_state.vector_store)
+                st.success(f"Compacted: {result['bytes_before'] / 1e6:.1f} MB → {result['bytes_after'] / 1e6:.1f} MB")
+            except ValueError as e:
+                st.error(str(e))
+    with col_export:
+        quantize = st.checkbox("Quantize vectors (int8, ~4x smaller)")
+        if st.button("📦 Export Snapshot"):
+            snapshot_path = os.path.join(SNAPSHOT_DIR, datetime.now().strftime("snapshot-%Y%m%d-%H%M%S"))
+            with st.spinner("Exporting..."):
+                manifest = export_snapshot(st.session_state.vector_store, snapshot_path, quantize=quantize)
+            st.success(f"Exported {manifest['count']} chunks to `{snapshot_path}`")
+    
+    import_path = st.text_input("Snapshot directory to import", placeholder=SNAPSHOT_DIR)
+    replace_existing = st.checkbox("Replace the whole database (otherwise only the snapshot's documents are replaced)")
+    if st.button("📥 Import Snapshot") and import_path:
+        try:
+            with st.spinner("Importing..."):
+                imported = import_snapshot(st.session_state.vector_store, import_path, replace=replace_existing)
+            st.success(f"Imported {imported} chunks without re-embedding")
+        except Exception as e:
+            st.error(f"Import failed: {e}")
+    
     st.markdown("---")
     st.subheader("Danger Zone")
     
-    if st.button("🗑️ Reset Database", type="primary"):
+    if st.button("🗑️ Reset Workspace", type="primary", help="Removes every document in this workspace only"):
         st.session_state.vector_store.reset_db()
-        st.success("Database has been reset!")
-        st.experimental_rerun()
+        st.success("Workspace has been reset!")
+        st.rerun()
+    
+    if st.session_state.workspace != COLLECTION_NAME:
+        if st.button("❌ Delete Workspace"):
+            registry.delete(st.session_state.workspace)
+            switch_workspace(COLLECTION_NAME)
+            st.rerun()
@@ -0,0 +1,375 @@
+import array
+import hashlib
+import mmap
+import os
+import pickle
+import threading
+import weakref
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class ChunkRecord:
+    """Lightweight view of one stored chunk."""
+    __slots__ = ("id", "source", "chunk_id", "offset", "length")
+
+    def __init__(self, id: int, source: str, chunk_id: int, offset: int, length: int):
+        self.id = id
+        self.source = source
+        self.chunk_id = chunk_id
+        self.offset = offset
+        self.length = length
+
+
+def _digest(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little", signed=True)
+
+
+class ChunkStore:
+    """
+    Compact store of chunk texts for context assembly.
+    Texts live back to back in a memory-mapped UTF-8 blob; per-chunk columns
+    (offset, length, source, chunk_id, content digest) are flat arrays indexed
+    by an integer chunk ID, so retrieval can pass plain ints around and only
+    decode the texts that end up in the prompt.
+    Deleted chunks are tombstoned (length -1) until the store is compacted.
+    The store is shared by every session, so all reads and writes hold _lock,
+    which is per directory: even two instances never interleave index writes.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._blob_path = os.path.join(directory, "chunks.blob")
+        self._index_path = os.path.join(directory, "chunks.idx")
+        self._lock = _directory_lock(directory)
+        self._mmap = None
+        self._mapped_size = 0
+        # Bumped whenever chunk IDs are reassigned (clear/compact), so holders of IDs can tell they are stale
+        self.generation = 0
+        self._reset_columns()
+        self._load()
+
+    def _reset_columns(self):
+        self._offsets = array.array("q")
+        self._lengths = array.array("q")
+        self._sources = array.array("i")
+        self._chunk_ids = array.array("i")
+        self._digests = array.array("q")
+        self._source_names: List[str] = []
+        self._source_index: Dict[str, int] = {}
+        self._by_key: Dict[Tuple[int, int], int] = {}
+        self._source_counts: Dict[int, int] = {}
+        self._live = 0
+
+    def _load(self):
+        if not os.path.exists(self._index_path):
+            return
+        try:
+            with open(self._index_path, "rb") as f:
+                state = pickle.load(f)
+        except Exception as e:
+            print(f"[ChunkStore] Could not load index, starting empty: {e}")
+            return
+        self._offsets = state["offsets"]
+        self._lengths = state["lengths"]
+        self._sources = state["sources"]
+        self._chunk_ids = state["chunk_ids"]
+        self._digests = state["digests"]
+        self._source_names = state["source_names"]
+        self._source_index = {name: i for i, name in enumerate(self._source_names)}
+        for i, length in enumerate(self._lengths):
+            if length >= 0:
+                self._by_key[(self._sources[i], self._chunk_ids[i])] = i
+                self._source_counts[self._sources[i]] = self._source_counts.get(self._sources[i], 0) + 1
+                self._live += 1
+
+    def _save(self):
+        state = {
+            "offsets": self._offsets,
+            "lengths": self._lengths,
+            "sources": self._sources,
+            "chunk_ids": self._chunk_ids,
+            "digests": self._digests,
+            "source_names": self._source_names,
+        }
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._index_path)
+
+    def _view(self):
+        """Returns a mapping of the blob, remapping if it grew since the last read."""
+        size = os.path.getsize(self._blob_path) if os.path.exists(self._blob_path) else 0
+        if size != self._mapped_size:
+            self._close_map()
+            if size:
+                with open(self._blob_path, "rb") as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped_size = size
+        return self._mmap
+
+    def _close_map(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+            self._mapped_size = 0
+
+    def __len__(self) -> int:
+        return self._live
+
+    def _append(self, source: str, chunks: List[str], start_chunk_id: int) -> List[int]:
+        if source not in self._source_index:
+            self._source_index[source] = len(self._source_names)
+            self._source_names.append(source)
+        source_idx = self._source_index[source]
+
+        offset = os.path.getsize(self._blob_path) if os.path.exists(self._blob_path) else 0
+        encoded = [chunk.encode("utf-8") for chunk in chunks]
+        with open(self._blob_path, "ab") as f:
+            f.write(b"".join(encoded))
+
+        ids = []
+        for i, data in enumerate(encoded):
+            chunk_id = start_chunk_id + i
+            new_id = len(self._offsets)
+            previous = self._by_key.get((source_idx, chunk_id))
+            if previous is not None:
+                self._lengths[previous] = -1
+                self._live -= 1
+                self._source_counts[source_idx] -= 1
+            self._offsets.append(offset)
+            self._lengths.append(len(data))
+            self._sources.append(source_idx)
+            self._chunk_ids.append(chunk_id)
+            self._digests.append(_digest(data))
+            self._by_key[(source_idx, chunk_id)] = new_id
+            self._source_counts[source_idx] = self._source_counts.get(source_idx, 0) + 1
+            self._live += 1
+            offset += len(data)
+            ids.append(new_id)
+        return ids
+
+    def add(self, source: str, chunks: List[str], start_chunk_id: int = 0, save: bool = True) -> List[int]:
+        """
+        Appends the chunks of one source and returns their IDs.
+        Pass save=False when a document is added in several batches and call flush() after the last one.
+        """
+        with self._lock:
+            ids = self._append(source, chunks, start_chunk_id)
+            if save:
+                self._save()
+            return ids
+
+    def add_many(self, rows: Iterable[Tuple[str, int, str]], save: bool = True):
+        """
+        Bulk-adds (source, chunk_id, text) rows in any order.
+        Contiguous runs of the same source are appended together and the index is saved once;
+        pass save=False when adding many batches and call flush() at the end.
+        """
+        with self._lock:
+            run_source, run_start, run = None, 0, []
+            for source, chunk_id, text in rows:
+                if run and (source != run_source or chunk_id != run_start + len(run)):
+                    self._append(run_source, run, run_start)
+                    run = []
+                if not run:
+                    run_source, run_start = source, chunk_id
+                run.append(text)
+            if run:
+                self._append(run_source, run, run_start)
+            if save:
+                self._save()
+
+    def flush(self):
+        """Persists the index."""
+        with self._lock:
+            self._save()
+
+    def delete_sources(self, sources: List[str]) -> int:
+        """Tombstones every chunk of the given sources. Returns the number removed."""
+        with self._lock:
+            source_ids = {self._source_index[s] for s in sources if s in self._source_index}
+            if not source_ids:
+                return 0
+            removed = 0
+            for key in [key for key in self._by_key if key[0] in source_ids]:
+                self._lengths[self._by_key.pop(key)] = -1
+                self._source_counts[key[0]] -= 1
+                removed += 1
+            self._live -= removed
+            if removed:
+                self._save()
+            return removed
+
+    def clear(self):
+        """Removes every chunk and truncates the blob."""
+        with self._lock:
+            self._close_map()
+            self._reset_columns()
+            open(self._blob_path, "wb").close()
+            self._save()
+            self.generation += 1
+
+    def compact(self) -> int:
+        """
+        Rewrites the blob and index without tombstoned chunks.
+        Chunk IDs are reassigned. Returns the number of bytes reclaimed.
+        """
+        with self._lock:
+            before = os.path.getsize(self._blob_path) if os.path.exists(self._blob_path) else 0
+            rows = [(r.source, r.chunk_id, self.text(r.id)) for r in self.iter_records()]
+            rows.sort(key=lambda row: (row[0], row[1]))
+            self.clear()
+            self.add_many(rows)
+            return before - os.path.getsize(self._blob_path)
+
+    def is_live(self, id: int) -> bool:
+        with self._lock:
+            return 0 <= id < len(self._lengths) and self._lengths[id] >= 0
+
+    def lookup(self, source: str, chunk_id: int) -> Optional[int]:
+        """Maps (source, chunk_id) metadata to a chunk ID, or None if unknown."""
+        with self._lock:
+            source_idx = self._source_index.get(source)
+            if source_idx is None:
+                return None
+            return self._by_key.get((source_idx, int(chunk_id)))
+
+    def count_source(self, source: str) -> int:
+        """Number of live chunks stored for a source."""
+        with self._lock:
+            source_idx = self._source_index.get(source)
+            if source_idx is None:
+                return 0
+            return self._source_counts.get(source_idx, 0)
+
+    def source(self, id: int) -> str:
+        with self._lock:
+            return self._source_names[self._sources[id]]
+
+    def record(self, id: int) -> ChunkRecord:
+        with self._lock:
+            return ChunkRecord(id, self.source(id), self._chunk_ids[id], self._offsets[id], self._lengths[id])
+
+    def text(self, id: int) -> str:
+        with self._lock:
+            view = self._view()
+            offset = self._offsets[id]
+            return view[offset:offset + self._lengths[id]].decode("utf-8")
+
+    def texts(self, ids: List[int]) -> List[str]:
+        with self._lock:
+            view = self._view()
+            return [view[self._offsets[i]:self._offsets[i] + self._lengths[i]].decode("utf-8") for i in ids]
+
+    def sources(self) -> List[str]:
+        """Returns the sorted names of sources that still have live chunks."""
+        with self._lock:
+            return sorted(self._source_names[i] for i, count in self._source_counts.items() if count > 0)
+
+    def sources_of(self, ids: List[int]) -> List[str]:
+        """Returns the distinct sources of the given chunks, in first-seen order."""
+        with self._lock:
+            return list(dict.fromkeys(self._source_names[self._sources[i]] for i in ids))
+
+    def dedupe(self, ids: List[int]) -> List[int]:
+        """Drops repeated IDs and chunks whose text duplicates an earlier one, keeping order."""
+        with self._lock:
+            digests = [self._digests[i] for i in ids]
+        seen_ids = set()
+        seen_digests = set()
+        unique = []
+        for i, digest in zip(ids, digests):
+            if i in seen_ids or digest in seen_digests:
+                continue
+            seen_ids.add(i)
+            seen_digests.add(digest)
+            unique.append(i)
+        return unique
+
+    def expand(self, ids: List[int], window: int) -> List[int]:
+        """
+        Adds the +/- window neighbouring chunks of each hit.
+        Hits keep their rank order; each hit is replaced by its neighbourhood in document order.
+        """
+        if window <= 0:
+            return list(ids)
+        expanded = []
+        seen = set()
+        with self._lock:
+            for i in ids:
+                source_idx = self._sources[i]
+                chunk_id = self._chunk_ids[i]
+                for neighbour_chunk in range(chunk_id - window, chunk_id + window + 1):
+                    neighbour = self._by_key.get((source_idx, neighbour_chunk))
+                    if neighbour is not None and neighbour not in seen:
+                        seen.add(neighbour)
+                        expanded.append(neighbour)
+        return expanded
+
+    def iter_records(self) -> Iterator[ChunkRecord]:
+        """Iterates over the chunks that were live when iteration started, in insertion order."""
+        with self._lock:
+            records = [self.record(i) for i, length in enumerate(self._lengths) if length >= 0]
+        yield from records
+
+
+# Stores live as long as anything (a session's VectorStoreManager, an ingest, a
+# re-index job) still references them, so reopening a directory never creates a
+# second instance that would overwrite the first one's index
+_stores: "weakref.WeakValueDictionary[str, ChunkStore]" = weakref.WeakValueDictionary()
+_stores_lock = threading.Lock()
+_directory_locks: Dict[str, threading.RLock] = {}
+
+
+def _directory_lock(directory: str) -> threading.RLock:
+    directory = os.path.abspath(directory)
+    with _stores_lock:
+        if directory not in _directory_locks:
+            _directory_locks[directory] = threading.RLock()
+        return _directory_locks[directory]
+
+
+def open_chunk_store(directory: str) -> ChunkStore:
+    """Returns the process-wide ChunkStore for a directory, shared across sessions."""
+    directory = os.path.abspath(directory)
+    with _stores_lock:
+        store = _stores.get(directory)
+    if store is None:
+        # Constructed outside _stores_lock (it takes the directory lock, which needs _stores_lock)
+        with _directory_lock(directory):
+            with _stores_lock:
+                store = _stores.get(directory)
+            if store is None:
+                store = ChunkStore(directory)
+                with _stores_lock:
+                    _stores[directory] = store
+    return store
+
+
+def discard_chunk_store(directory: str):
+    """
+    Forgets the shared ChunkStore (and lock) of a directory that is being deleted,
+    so the next open_chunk_store starts from an empty directory instead of
+    handing out the old instance to whoever re-creates it.
+    """
+    directory = os.path.abspath(directory)
+    with _stores_lock:
+        store = _stores.pop(directory, None)
+        _directory_locks.pop(directory, None)
+    if store is not None:
+        with store._lock:
+            store._close_map()
+
+
+def close_chunk_store(directory: str):
+    """
+    Unmaps the shared ChunkStore of a directory to release memory. The instance
+    stays shared while still referenced; it remaps itself on the next read.
+    """
+    directory = os.path.abspath(directory)
+    with _stores_lock:
+        store = _stores.get(directory)
+    if store is not None:
+        with store._lock:
+            store._close_map()
@@ -5,11 +5,15 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 CHROMA_DB_DIR = os.path.join(BASE_DIR, "chroma_db")
 MODELS_DIR = os.path.join(BASE_DIR, "models")
+OCR_CACHE_DIR = os.path.join(BASE_DIR, "ocr_cache")
+SNAPSHOT_DIR = os.path.join(BASE_DIR, "snapshots")
 
 # Create directories if they don't exist
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(CHROMA_DB_DIR, exist_ok=True)
 os.makedirs(MODELS_DIR, exist_ok=True)
+os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+os.makedirs(SNAPSHOT_DIR, exist_ok=True)
 
 # Model Settings
 # Using Phi-3 Mini (3.8B) - Local GGUF
@@ -18,15 +22,114 @@ MODEL_PATH = os.path.join(MODELS_DIR, MODEL_NAME)
 
 # Embedding Model (CPU friendly)
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Models a workspace can be re-indexed with from the UI. Models are loaded
+# without trust_remote_code, so only architectures built into sentence-transformers work
+EMBEDDING_MODELS = [
+    EMBEDDING_MODEL_NAME,
+    "all-mpnet-base-v2",
+    "multi-qa-MiniLM-L6-cos-v1",
+    "BAAI/bge-small-en-v1.5",
+    "BAAI/bge-base-en-v1.5",
+]
 
 # ChromaDB Settings
+# Default collection; every workspace (tenant) gets its own collection
 COLLECTION_NAME = "research_papers"
 
+# Chunk texts are also kept in a compact memory-mapped store next to Chroma,
+# so context assembly never has to re-read documents from the collection
+CHUNK_STORE_DIR = os.path.join(CHROMA_DB_DIR, "chunk_store")
+
+# Rows per batch when exporting/importing knowledge-base snapshots
+SNAPSHOT_BATCH_SIZE = 1000
+
+# Workspace (tenant) Settings
+# Max chunks stored per workspace (0 = unlimited)
+TENANT_MAX_CHUNKS = 200_000
+# Max simultaneous LLM calls per workspace, and how long a request waits for a slot
+TENANT_MAX_CONCURRENT_LLM_CALLS = 2
+TENANT_LLM_WAIT_SECONDS = 10
+# Workspaces kept open in memory; idle ones beyond this are closed
+MAX_OPEN_WORKSPACES = 8
+
+# Embedding Space Settings
+# Switching the embedding model re-indexes a workspace into a new collection with this prefix
+# (hidden from the workspace list) from the stored chunk texts, in the background
+EMBEDDING_SPACE_PREFIX = "space-"
+# Chunks embedded per batch, and the cap on re-index throughput (0 = unthrottled)
+REINDEX_BATCH_SIZE = 64
+REINDEX_MAX_CHUNKS_PER_SECOND = 50
+# Fraction of queries also run against the index being built, to report how well the two agree
+REINDEX_SHADOW_READ_RATE = 0.1
+
+# Evaluation Settings
+# Collections built by the evaluation harness (hidden from the workspace list).
+# They live in their own Chroma directory, never in CHROMA_DB_DIR
+EVAL_COLLECTION_PREFIX = "eval-"
+EVAL_INDEX_DIR = os.path.join(BASE_DIR, "eval_indexes")
+
+# Ingest Resource Settings
+# Uploads larger than this are rejected; PDFs are ingested up to this many pages (0 = no limit)
+INGEST_MAX_FILE_MB = 200
+INGEST_MAX_PAGES = 2000
+# Caps on concurrent ingests (across all sessions) and on pages extracted ahead of indexing.
+# 0 derives them from the CPU count and the memory available to the process (container limit included)
+INGEST_MAX_WORKERS = 0
+INGEST_MAX_INFLIGHT_PAGES = 0
+# Memory budgeted per ingest worker and per page in flight (a 300-DPI page raster plus Tesseract)
+INGEST_WORKER_MEMORY_MB = 512
+INGEST_PAGE_MEMORY_MB = 48
+# Chunks embedded and written per batch (halved when memory is tight)
+INGEST_CHUNK_BATCH = 64
+# Extraction pauses while less memory than this is available, for at most INGEST_MEMORY_WAIT_SECONDS per page
+INGEST_MIN_FREE_MEMORY_MB = 256
+INGEST_MEMORY_WAIT_SECONDS = 30
+
 # Chunking Settings
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 
+# Retrieval Settings
+# Number of neighbouring chunks (on each side) pulled in around every hit
+CONTEXT_EXPANSION_WINDOW = 0
+
+# Conversation Settings
+# Token budget for chat history (rolling summary + recent turns) in the prompt
+CONVERSATION_HISTORY_TOKENS = 600
+# Turns kept verbatim before they are folded into the summary
+CONVERSATION_RECENT_TURNS = 2
+# Use the LLM to rewrite follow-up questions (costs an extra short call);
+# otherwise follow-ups are expanded with the previous standalone question
+CONVERSATION_LLM_REWRITE = False
+
+# Latency Settings
+# Speculative retrieval waits this long after the last keystroke before searching
+SPECULATIVE_DEBOUNCE_SECONDS = 0.3
+# Streamed answers are redrawn at most once per interval instead of per token
+STREAM_FLUSH_INTERVAL_SECONDS = 0.05
+
 # OCR Settings
 # Ensure Tesseract is installed on the system
 # sudo apt-get install tesseract-ocr (Linux)
 # brew install tesseract (Mac)
+
+# Pages are first rendered at a tiny probe resolution to detect blank pages
+# and estimate ink density; the real OCR resolution is derived from that.
+OCR_PROBE_DPI = 36
+OCR_MIN_DPI = 150
+OCR_BASE_DPI = 200
+OCR_DENSE_DPI = 300
+# Re-run OCR at this resolution only when confidence is below OCR_MIN_CONFIDENCE
+OCR_RETRY_DPI = 400
+OCR_MIN_CONFIDENCE = 60.0
+# Upper bound on rendered page / image size handed to Tesseract
+OCR_MAX_PIXELS = 12_000_000
+# Grey level (0-255) below which a pixel counts as ink
+OCR_INK_THRESHOLD = 128
+# Fraction of ink pixels below which a page counts as blank, and above
+# which it counts as densely printed (small glyphs -> higher DPI)
+OCR_BLANK_INK_RATIO = 0.002
+OCR_DENSE_INK_RATIO = 0.06
+# Tesseract page-segmentation modes: the first is used for the initial pass,
+# all of them are tried on a low-confidence retry (3 = auto, 6 = single block)
+OCR_PSM_MODES = [3, 6]
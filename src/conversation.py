@@ -0,0 +1,155 @@
+import re
+from typing import List, Optional
+from src.config import CONVERSATION_HISTORY_TOKENS, CONVERSATION_RECENT_TURNS
+
+# Words that usually point back at something said in an earlier turn
+FOLLOW_UP_WORDS = {
+    "it", "its", "they", "them", "their", "theirs", "this", "that", "these", "those",
+    "he", "she", "his", "her", "above", "previous", "earlier", "same", "former", "latter",
+}
+# Elliptical openers that only make sense after an earlier turn
+FOLLOW_UP_PREFIXES = ("what about", "how about", "elaborate", "tell me more", "more on")
+# A query with a pronoun but more topic terms than this stands on its own
+# ("What is BERT and how does it compare to GPT?")
+MAX_FOLLOW_UP_TERMS = 1
+
+STOPWORDS = {
+    "what", "which", "where", "when", "who", "whom", "whose", "how", "does", "did", "do",
+    "is", "are", "was", "were", "be", "been", "the", "a", "an", "of", "in", "on", "for",
+    "to", "and", "or", "with", "about", "more", "tell", "explain", "describe", "please",
+    "can", "could", "would", "should", "there", "then", "than", "into", "from", "some",
+}
+
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9\-]*")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for history budgeting."""
+    return (len(text) + 3) // 4
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def content_terms(text: str) -> set:
+    """Lower-cased words that carry topic information (no stopwords or pronouns)."""
+    return {w for w in _words(text) if len(w) > 3 and w not in STOPWORDS and w not in FOLLOW_UP_WORDS}
+
+
+def is_follow_up(query: str) -> bool:
+    """
+    True when the query likely depends on an earlier turn to make sense: it opens
+    elliptically ("what about ...") or has an unresolved reference ("it", "those")
+    and next to no topic terms of its own.
+    """
+    lowered = query.strip().lower()
+    if lowered.startswith(FOLLOW_UP_PREFIXES):
+        return True
+    if not any(w in FOLLOW_UP_WORDS for w in _words(lowered)):
+        return False
+    return len(content_terms(lowered)) <= MAX_FOLLOW_UP_TERMS
+
+
+def can_reuse_context(last: Optional["ConversationTurn"], query: str, source_filter: Optional[List[str]], store) -> bool:
+    """
+    True when a follow-up can be answered from the previous turn's chunks: it adds
+    no topic terms of its own, keeps the same source filter, and none of those
+    chunks were deleted or renumbered (store: the ChunkStore they came from).
+    """
+    return (last is not None and bool(last.chunk_ids) and is_follow_up(query)
+            and last.store_generation == store.generation
+            and all(store.is_live(i) for i in last.chunk_ids)
+            and last.source_filter == sorted(source_filter or [])
+            and not content_terms(query) - content_terms(f"{last.standalone_query} {last.answer}"))
+
+
+def _first_sentence(text: str, max_chars: int = 200) -> str:
+    text = " ".join(text.split())
+    match = re.search(r"[.!?](\s|$)", text)
+    if match:
+        text = text[:match.start() + 1]
+    return text[:max_chars]
+
+
+class ConversationTurn:
+    __slots__ = ("query", "standalone_query", "answer", "chunk_ids", "sources", "reused_context", "store_generation",
+                 "source_filter")
+
+    def __init__(self, query: str, standalone_query: str, chunk_ids: List[int], sources: List[str], reused_context: bool,
+                 store_generation: int = 0, source_filter: Optional[List[str]] = None):
+        self.query = query
+        self.standalone_query = standalone_query
+        self.answer = ""
+        self.chunk_ids = chunk_ids
+        self.sources = sources
+        self.reused_context = reused_context
+        self.store_generation = store_generation
+        self.source_filter = sorted(source_filter) if source_filter else []
+
+
+class ConversationState:
+    """
+    Per-chat memory for conversation-aware retrieval.
+    The last CONVERSATION_RECENT_TURNS turns are kept verbatim; older turns are
+    folded into a short extractive summary so the history sent to the LLM stays
+    within CONVERSATION_HISTORY_TOKENS.
+    """
+
+    def __init__(self, history_tokens: int = CONVERSATION_HISTORY_TOKENS, recent_turns: int = CONVERSATION_RECENT_TURNS):
+        self.history_tokens = history_tokens
+        self.recent_turns = max(1, recent_turns)
+        self.turns: List[ConversationTurn] = []
+        self.summary_lines: List[str] = []
+
+    @property
+    def last_turn(self) -> Optional[ConversationTurn]:
+        return self.turns[-1] if self.turns else None
+
+    def start_turn(self, query: str, standalone_query: str, chunk_ids: List[int], sources: List[str], reused_context: bool = False,
+                   store_generation: int = 0, source_filter: Optional[List[str]] = None) -> ConversationTurn:
+        turn = ConversationTurn(query, standalone_query, chunk_ids, sources, reused_context, store_generation, source_filter)
+        self.turns.append(turn)
+        return turn
+
+    def record_answer(self, answer: str):
+        """Stores the assistant answer for the current turn and rolls old turns into the summary."""
+        if not self.turns:
+            return
+        self.turns[-1].answer = answer
+        while len(self.turns) > self.recent_turns:
+            old = self.turns.pop(0)
+            self.summary_lines.append(f"- Q: {old.standalone_query} A: {_first_sentence(old.answer)}")
+        # Keep the summary to at most half of the history budget, dropping the oldest lines
+        while self.summary_lines and estimate_tokens("\n".join(self.summary_lines)) > self.history_tokens // 2:
+            self.summary_lines.pop(0)
+
+    def history_text(self) -> str:
+        """Returns the summary plus recent turns, trimmed to the token budget."""
+        recent = []
+        for turn in self.turns:
+            if turn.answer:
+                recent.append(f"User: {turn.query}\nAssistant: {turn.answer}")
+
+        summary = ""
+        if self.summary_lines:
+            summary = "Earlier in this conversation:\n" + "\n".join(self.summary_lines)
+
+        # Every part is costed with the "\n\n" joining it to the next, so the joined text stays within budget
+        budget = self.history_tokens - (estimate_tokens(summary + "\n\n") if summary else 0)
+        kept = []
+        for entry in reversed(recent):
+            cost = estimate_tokens(entry + "\n\n")
+            if cost > budget:
+                # Truncate the oldest entry that still fits partially
+                if budget > 0 and not kept:
+                    kept.append(entry[:budget * 4 - 2])
+                break
+            kept.append(entry)
+            budget -= cost
+
+        return "\n\n".join(part for part in [summary] + list(reversed(kept)) if part)
+
+    def clear(self):
+        self.turns = []
+        self.summary_lines = []
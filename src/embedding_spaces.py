@@ -0,0 +1,220 @@
+"""
+Versioned embedding spaces and background re-indexing.
+
+Each workspace keeps its chunk texts once, in the chunk store. Every embedding
+model the workspace is indexed with gets its own Chroma collection (a "space").
+spaces.json, next to the chunk store, records which space serves queries
+("active") and which one is being built ("pending"):
+
+    {"active":  {"model": "all-MiniLM-L6-v2", "collection": "research_papers"},
+     "pending": {"model": "bge-small-en-v1.5", "collection": "space-...", "started": "..."},
+     "retired": []}
+
+While a space is pending, queries keep using the active one, new documents and
+deletes are written to both, and a ReindexJob embeds the stored texts into the
+pending space in throttled batches. When it has caught up, the manifest is
+swapped with os.replace and the old collection is dropped, so a crash at any
+point leaves either the old or the new space active, never a half-built one.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from src.config import EMBEDDING_SPACE_PREFIX, REINDEX_BATCH_SIZE, REINDEX_MAX_CHUNKS_PER_SECOND
+
+SPACES_FILE = "spaces.json"
+
+
+def space_collection_name(workspace: str, model_name: str, salt: str = "") -> str:
+    """
+    Chroma collection holding a workspace's vectors for one embedding model.
+    salt: Distinguishes rebuilds with the same model (e.g. compaction).
+    """
+    digest = hashlib.sha1(f"{workspace}\0{model_name}\0{salt}".encode("utf-8")).hexdigest()[:16]
+    return f"{EMBEDDING_SPACE_PREFIX}{digest}"
+
+
+def read_spaces(directory: str, default_model: str, default_collection: str) -> Dict:
+    """Loads spaces.json; workspaces that never switched models get a single implicit space."""
+    path = os.path.join(directory, SPACES_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            spaces = json.load(f)
+    else:
+        spaces = {"active": {"model": default_model, "collection": default_collection}}
+    spaces.setdefault("pending", None)
+    spaces.setdefault("retired", [])
+    return spaces
+
+
+def write_spaces(directory: str, spaces: Dict):
+    """Writes spaces.json atomically, so readers see either the old or the new manifest."""
+    path = os.path.join(directory, SPACES_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(spaces, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ReindexJob:
+    """
+    Builds a VectorStoreManager's pending space from the texts in its chunk store.
+    Works one source at a time on a background thread, embedding at most
+    max_rate chunks per second so queries on the active space stay responsive.
+    Chunks already present in the pending space (written there by dual writes,
+    or by an earlier run before a restart) are skipped, so a document whose
+    streamed ingest straddled the start of the job only has its earlier
+    batches embedded. Once a pass finds nothing left to do, the manager cuts
+    over to the new space.
+    """
+
+    def __init__(self, manager, batch_size: int = REINDEX_BATCH_SIZE, max_rate: float = REINDEX_MAX_CHUNKS_PER_SECOND):
+        self.manager = manager
+        self.model_name = manager.pending_model_name
+        self.batch_size = max(1, batch_size)
+        self.max_rate = max_rate
+        self.total = len(manager.chunk_store)
+        self.done = 0
+        self.embedded = 0
+        self.error = None
+        self.cut_over = False
+        self.started = time.perf_counter()
+        self.finished = None
+        self._completed_sources = set()
+        self._shadow_reads = 0
+        self._shadow_agreement = 0.0
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="reindex", daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self) -> bool:
+        return self.finished is None
+
+    def cancel(self, wait: bool = True):
+        """Stops the job after the current batch; the pending space is left as is."""
+        self._cancel.set()
+        if wait and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        try:
+            for _ in range(3):
+                if not self._index_pass() or self._cancel.is_set():
+                    break
+            if not self._cancel.is_set():
+                self.cut_over = self.manager._cut_over()
+                if not self.cut_over:
+                    self.error = RuntimeError("Pending index did not converge with the active one; re-index again.")
+        except Exception as e:
+            print(f"[Reindex] Failed: {e}")
+            self.error = e
+        finally:
+            self.finished = time.perf_counter()
+
+    def _index_pass(self) -> int:
+        """Embeds every source missing from the pending space. Returns the number of chunks written."""
+        manager = self.manager
+        store = manager.chunk_store
+        with self._lock:
+            self.total = len(store)
+            self.done = 0
+        written = 0
+        for source in store.sources():
+            if self._cancel.is_set():
+                break
+            version = manager._source_version(source)
+            pending = manager.pending_db._collection
+            old = manager.vector_db._collection.get(where={"source": source}, include=["metadatas"])
+            present = set(pending.get(where={"source": source}, include=[])["ids"])
+            if all(chunk_key in present for chunk_key in old["ids"]):
+                self._mark_done(source, len(old["ids"]))
+                continue
+
+            ids, texts, metadatas = [], [], []
+            skipped = 0
+            for chunk_key, meta in zip(old["ids"], old["metadatas"]):
+                if chunk_key in present:
+                    skipped += 1
+                    continue
+                chunk = store.lookup(source, meta.get("chunk_id", 0))
+                if chunk is not None:
+                    ids.append(chunk_key)
+                    texts.append(store.text(chunk))
+                    metadatas.append(meta)
+
+            embeddings = []
+            for start in range(0, len(texts), self.batch_size):
+                if self._cancel.is_set():
+                    return written
+                batch_started = time.perf_counter()
+                embeddings.extend(manager.pending_embedding_function.embed_documents(texts[start:start + self.batch_size]))
+                self.embedded += len(texts[start:start + self.batch_size])
+                if self.max_rate:
+                    budget = len(texts[start:start + self.batch_size]) / self.max_rate
+                    self._cancel.wait(max(0.0, budget - (time.perf_counter() - batch_started)))
+
+            # Only write if the source was not re-uploaded or deleted while it was being embedded
+            with manager._write_lock:
+                if ids and manager._source_version(source) == version:
+                    pending.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+                    written += len(ids)
+            self._mark_done(source, skipped + len(ids))
+        return written
+
+    def _mark_done(self, source: str, chunks: int):
+        with self._lock:
+            self._completed_sources.add(source)
+            self.done += chunks
+
+    def shadow_read(self, query: str, k: int, source_filter: Optional[List[str]], active_keys: List[tuple]):
+        """
+        Runs the query against the pending space in the background and records how
+        many active-space hits (from sources already re-indexed) it also returns.
+        """
+        def compare():
+            try:
+                embedding = self.manager.pending_embedding_function.embed_query(query)
+                where = {"source": {"$in": source_filter}} if source_filter else None
+                result = self.manager.pending_db._collection.query(
+                    query_embeddings=[embedding], n_results=k, where=where, include=["metadatas"]
+                )
+                new_keys = {(m.get("source"), m.get("chunk_id")) for m in (result["metadatas"][0] if result["metadatas"] else [])}
+                with self._lock:
+                    comparable = [key for key in active_keys if key[0] in self._completed_sources]
+                    if not comparable:
+                        return
+                    agreement = sum(key in new_keys for key in comparable) / len(comparable)
+                    self._shadow_agreement += (agreement - self._shadow_agreement) / (self._shadow_reads + 1)
+                    self._shadow_reads += 1
+            except Exception as e:
+                print(f"[Reindex] Shadow read failed: {e}")
+
+        threading.Thread(target=compare, name="reindex-shadow", daemon=True).start()
+
+    def progress(self) -> Dict:
+        """Snapshot of the job's progress for the UI."""
+        with self._lock:
+            elapsed = (self.finished or time.perf_counter()) - self.started
+            rate = self.embedded / elapsed if elapsed > 0 else 0.0
+            remaining = max(0, self.total - self.done)
+            return {
+                "model": self.model_name,
+                "done": self.done,
+                "total": self.total,
+                "fraction": self.done / self.total if self.total else 1.0,
+                "chunks_per_second": rate,
+                "eta_seconds": remaining / rate if rate else None,
+                "elapsed_seconds": elapsed,
+                "shadow_reads": self._shadow_reads,
+                "shadow_agreement": self._shadow_agreement if self._shadow_reads else None,
+                "running": self.running,
+                "cut_over": self.cut_over,
+                "error": str(self.error) if self.error else None,
+            }
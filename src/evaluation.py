@@ -0,0 +1,384 @@
+"""
+Offline answer-quality regression harness for RAGPipeline.
+
+Dataset: JSONL, one question per line:
+    {"question": "...",
+     "expected_sources": ["paper.pdf"],                         # source-level labels
+     "expected_chunks": [{"source": "paper.pdf", "chunk_id": 3}], # optional chunk-level labels
+     "reference_answer": "..."}                                  # optional
+
+Chunk-level labels only make sense for the chunk size/overlap they were made
+with; use source-level labels when sweeping chunking settings.
+
+Each configuration in the grid (k, chunk size, overlap, embedding model, prompt)
+is evaluated against an index built from the corpus directory. Indexes are
+cached in dedicated collections (named with EVAL_COLLECTION_PREFIX) under
+EVAL_INDEX_DIR, apart from the app's knowledge bases, and reused across
+configurations and runs. --clean deletes them first (along with eval-*
+collections that older versions left in CHROMA_DB_DIR).
+
+Usage:
+    python -m src.evaluation --dataset eval.jsonl --corpus data \\
+        --k 5 10 --chunk-size 500 1000 --llm stub --workers 4 --output results.json
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import chromadb
+
+from src.config import (
+    CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL_NAME, DATA_DIR, MODEL_PATH, EVAL_COLLECTION_PREFIX, EVAL_INDEX_DIR,
+    CHROMA_DB_DIR, CHUNK_STORE_DIR
+)
+from src.conversation import estimate_tokens
+from src.ingest import process_local_file
+from src.llm import LLMEngine
+from src.prompts import SYSTEM_PROMPT
+from src.rag import RAGPipeline
+from src.vector_store import VectorStoreManager
+
+# Prompt variants selectable with --prompt
+PROMPT_VARIANTS = {
+    "default": SYSTEM_PROMPT,
+    "concise": (
+        "You are a research assistant. Answer in at most three sentences using ONLY the context below. "
+        "If the context does not contain the answer, say: \"I cannot answer this based on the provided documents.\"\n"
+    ),
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def token_f1(prediction: str, reference: str) -> float:
+    """SQuAD-style token-overlap F1 between an answer and the reference answer."""
+    predicted = _tokens(prediction)
+    expected = _tokens(reference)
+    if not predicted or not expected:
+        return float(predicted == expected)
+    overlap = sum((Counter(predicted) & Counter(expected)).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / len(predicted)
+    recall = overlap / len(expected)
+    return 2 * precision * recall / (precision + recall)
+
+
+class StubLLMEngine:
+    """
+    Deterministic extractive stand-in for the LLM: answers with the context
+    sentences that share the most words with the question. Free and repeatable,
+    so retrieval and prompt changes can be compared without API calls.
+    """
+
+    model = "stub"
+
+    def generate_response(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.2, stream: bool = False) -> str:
+        context = prompt.split("Context:\n", 1)[-1].split("\n\nUser: ", 1)[0]
+        question = prompt.rsplit("User: ", 1)[-1].split("\n\nAssistant:", 1)[0]
+        question_terms = set(_tokens(question))
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", context) if s.strip()]
+        ranked = sorted(sentences, key=lambda s: len(question_terms & set(_tokens(s))), reverse=True)
+        answer = []
+        for sentence in ranked[:3]:
+            if question_terms & set(_tokens(sentence)):
+                answer.append(sentence)
+        return " ".join(answer) or "I cannot answer this based on the provided documents."
+
+    def is_model_loaded(self) -> bool:
+        return True
+
+
+class LocalLLMEngine:
+    """Runs the local GGUF model (MODEL_PATH) through llama-cpp-python."""
+
+    def __init__(self, model_path: str = MODEL_PATH):
+        try:
+            from llama_cpp import Llama
+        except ImportError:
+            raise ValueError("llama-cpp-python is not installed; use --llm stub or --llm groq instead.")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Local model not found at {model_path}. Run download_model.py first.")
+        self.model = os.path.basename(model_path)
+        self._llm = Llama(model_path=model_path, n_ctx=4096, verbose=False)
+        self._lock = threading.Lock()
+
+    def generate_response(self, prompt: str, max_tokens: int = 512, temperature: float = 0.2, stream: bool = False) -> str:
+        with self._lock:
+            output = self._llm(prompt, max_tokens=max_tokens, temperature=temperature, stop=["User:"])
+        return output["choices"][0]["text"].strip()
+
+    def is_model_loaded(self) -> bool:
+        return True
+
+
+def make_llm(kind: str):
+    if kind == "stub":
+        return StubLLMEngine()
+    if kind == "local":
+        return LocalLLMEngine()
+    if kind == "groq":
+        engine = LLMEngine()
+        engine.load_model()
+        return engine
+    raise ValueError(f"Unknown LLM '{kind}' (expected stub, local or groq)")
+
+
+def load_dataset(path: str) -> List[Dict]:
+    """Reads the JSONL dataset and normalizes the label fields."""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            if "question" not in row:
+                raise ValueError(f"{path}:{line_number}: missing 'question'")
+            sources = row.get("expected_sources") or ([row["expected_source"]] if row.get("expected_source") else [])
+            items.append({
+                "question": row["question"],
+                "expected_sources": set(sources),
+                "expected_chunks": {(c["source"], int(c["chunk_id"])) for c in row.get("expected_chunks", [])},
+                "reference_answer": row.get("reference_answer", ""),
+            })
+    return items
+
+
+def config_grid(ks: List[int], chunk_sizes: List[int], chunk_overlaps: List[int],
+                embedding_models: List[str], prompts: List[str]) -> List[Dict]:
+    """Cartesian product of the settings, skipping overlaps that are not smaller than the chunk size."""
+    grid = []
+    for k, size, overlap, model, prompt in itertools.product(ks, chunk_sizes, chunk_overlaps, embedding_models, prompts):
+        if overlap >= size:
+            continue
+        if prompt not in PROMPT_VARIANTS:
+            raise ValueError(f"Unknown prompt variant '{prompt}' (expected one of {sorted(PROMPT_VARIANTS)})")
+        grid.append({"k": k, "chunk_size": size, "chunk_overlap": overlap, "embedding_model": model, "prompt": prompt})
+    return grid
+
+
+def retrieval_scores(ranked: List[Tuple[str, int]], item: Dict) -> Tuple[float, float]:
+    """Returns (recall@k, reciprocal rank) of the ranked (source, chunk_id) hits, or (None, None) without labels."""
+    if item["expected_chunks"]:
+        expected = item["expected_chunks"]
+        found = expected & set(ranked)
+        is_relevant = lambda hit: hit in expected
+    elif item["expected_sources"]:
+        expected = item["expected_sources"]
+        found = expected & {source for source, _ in ranked}
+        is_relevant = lambda hit: hit[0] in expected
+    else:
+        return None, None
+
+    reciprocal_rank = 0.0
+    for rank, hit in enumerate(ranked, start=1):
+        if is_relevant(hit):
+            reciprocal_rank = 1.0 / rank
+            break
+    return len(found) / len(expected), reciprocal_rank
+
+
+class IndexCache:
+    """
+    Builds (or reuses) one evaluation collection per (embedding model, chunk size, overlap).
+    The corpus is extracted once and shared by every build.
+    index_dir: Chroma directory for the evaluation indexes (never the app's CHROMA_DB_DIR).
+    """
+
+    def __init__(self, corpus_dir: str, index_dir: str = EVAL_INDEX_DIR):
+        self.corpus_dir = corpus_dir
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple, threading.Lock] = {}
+        self._managers: Dict[Tuple, Tuple[VectorStoreManager, bool]] = {}
+        self._corpus = None
+        self.ocr_pages = 0
+        self.ocr_cache_hits = 0
+        files = sorted(f for f in os.listdir(corpus_dir) if os.path.isfile(os.path.join(corpus_dir, f)))
+        signature = [(f, os.path.getsize(os.path.join(corpus_dir, f)), int(os.path.getmtime(os.path.join(corpus_dir, f)))) for f in files]
+        self._files = files
+        self._signature = json.dumps(signature)
+
+    def _load_corpus(self) -> List[Tuple[str, str, List[Dict]]]:
+        with self._lock:
+            if self._corpus is None:
+                corpus = []
+                for f in self._files:
+                    filename, text, ocr_pages = process_local_file(os.path.join(self.corpus_dir, f))
+                    if text:
+                        corpus.append((filename, text, ocr_pages))
+                    self.ocr_pages += sum(1 for p in ocr_pages if not p["ocr_skipped"])
+                    self.ocr_cache_hits += sum(1 for p in ocr_pages if p["ocr_cached"])
+                self._corpus = corpus
+            return self._corpus
+
+    def get(self, config: Dict) -> Tuple[VectorStoreManager, bool]:
+        """Returns (manager, reused) for the config's index, building it if necessary."""
+        key = (config["embedding_model"], config["chunk_size"], config["chunk_overlap"])
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key in self._managers:
+                return self._managers[key][0], True
+
+            digest = hashlib.sha1(json.dumps([list(key), self._signature]).encode("utf-8")).hexdigest()[:16]
+            manager = VectorStoreManager(
+                f"{EVAL_COLLECTION_PREFIX}{digest}",
+                max_chunks=0,
+                embedding_model=config["embedding_model"],
+                chunk_size=config["chunk_size"],
+                chunk_overlap=config["chunk_overlap"],
+                persist_directory=self.index_dir
+            )
+            marker = os.path.join(manager.chunk_store.directory, "eval_complete")
+            reused = os.path.exists(marker) and len(manager.chunk_store) > 0
+            if not reused:
+                print(f"[Eval] Building index {manager.collection_name} for {key}")
+                manager.reset_db()
+                for filename, text, ocr_pages in self._load_corpus():
+                    manager.add_document(filename, text, ocr_pages)
+                open(marker, "w").close()
+            self._managers[key] = (manager, reused)
+            return manager, reused
+
+
+def evaluate_config(config: Dict, items: List[Dict], indexes: IndexCache, llm) -> Dict:
+    """Runs every question through one configuration and aggregates quality, cost and latency."""
+    manager, index_reused = indexes.get(config)
+    pipeline = RAGPipeline(vector_store=manager)
+    pipeline.llm_engine = llm
+    pipeline.system_prompt = PROMPT_VARIANTS[config["prompt"]]
+    store = manager.chunk_store
+
+    recalls, reciprocal_ranks, f1s = [], [], []
+    prompt_tokens, retrieval_times, answer_times = [], [], []
+    for item in items:
+        started = time.perf_counter()
+        ids = pipeline.retrieve_ids(item["question"], k=config["k"], expand=0)
+        retrieval_times.append(time.perf_counter() - started)
+
+        ranked = [(store.source(i), store.record(i).chunk_id) for i in ids]
+        recall, reciprocal_rank = retrieval_scores(ranked, item)
+        if recall is not None:
+            recalls.append(recall)
+            reciprocal_ranks.append(reciprocal_rank)
+
+        prompt = pipeline.construct_prompt(item["question"], store.texts(ids))
+        prompt_tokens.append(estimate_tokens(prompt))
+        started = time.perf_counter()
+        answer = llm.generate_response(prompt)
+        answer_times.append(time.perf_counter() - started)
+        if item["reference_answer"]:
+            f1s.append(token_f1(answer, item["reference_answer"]))
+
+    mean = lambda values: sum(values) / len(values) if values else None
+    return dict(config, **{
+        "questions": len(items),
+        "recall_at_k": mean(recalls),
+        "mrr": mean(reciprocal_ranks),
+        "answer_f1": mean(f1s),
+        "prompt_tokens": mean(prompt_tokens),
+        "total_prompt_tokens": sum(prompt_tokens),
+        "retrieval_ms_p50": sorted(retrieval_times)[len(retrieval_times) // 2] * 1000 if retrieval_times else None,
+        "answer_s_mean": mean(answer_times),
+        "index_cache_hit": index_reused,
+    })
+
+
+def clean_indexes(index_dir: str = EVAL_INDEX_DIR):
+    """
+    Deletes the cached evaluation indexes, plus eval-* collections and chunk
+    stores that earlier versions of the harness built inside CHROMA_DB_DIR.
+    """
+    shutil.rmtree(index_dir, ignore_errors=True)
+    client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+    for collection in client.list_collections():
+        name = collection if isinstance(collection, str) else collection.name
+        if name.startswith(EVAL_COLLECTION_PREFIX):
+            client.delete_collection(name)
+    if os.path.isdir(CHUNK_STORE_DIR):
+        for name in os.listdir(CHUNK_STORE_DIR):
+            if name.startswith(EVAL_COLLECTION_PREFIX):
+                shutil.rmtree(os.path.join(CHUNK_STORE_DIR, name), ignore_errors=True)
+    print("[Eval] Removed cached evaluation indexes")
+
+
+def run_grid(items: List[Dict], grid: List[Dict], corpus_dir: str, llm_kind: str = "stub", workers: int = 4,
+             index_dir: str = EVAL_INDEX_DIR) -> Tuple[List[Dict], IndexCache]:
+    """Evaluates every configuration in parallel. Returns (results, index cache)."""
+    indexes = IndexCache(corpus_dir, index_dir)
+    llm = make_llm(llm_kind)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(lambda config: evaluate_config(config, items, indexes, llm), grid))
+    return results, indexes
+
+
+def format_table(results: List[Dict]) -> str:
+    """Markdown comparison table, best recall first."""
+    columns = [
+        ("k", "k", "{}"), ("chunk", "chunk_size", "{}"), ("overlap", "chunk_overlap", "{}"),
+        ("embedding", "embedding_model", "{}"), ("prompt", "prompt", "{}"),
+        ("recall@k", "recall_at_k", "{:.3f}"), ("MRR", "mrr", "{:.3f}"), ("F1", "answer_f1", "{:.3f}"),
+        ("prompt tok", "prompt_tokens", "{:.0f}"), ("retr ms p50", "retrieval_ms_p50", "{:.1f}"),
+        ("answer s", "answer_s_mean", "{:.2f}"), ("index cached", "index_cache_hit", "{}"),
+    ]
+    ordered = sorted(results, key=lambda r: (r["recall_at_k"] or 0, r["mrr"] or 0), reverse=True)
+    lines = [
+        "| " + " | ".join(title for title, _, _ in columns) + " |",
+        "|" + "|".join("---" for _ in columns) + "|",
+    ]
+    for row in ordered:
+        cells = ["-" if row[key] is None else fmt.format(row[key]) for _, key, fmt in columns]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval and answer quality across RAG configurations.")
+    parser.add_argument("--dataset", required=True, help="JSONL file of questions with expected sources/answers")
+    parser.add_argument("--corpus", default=DATA_DIR, help="Directory with the documents to index")
+    parser.add_argument("--k", type=int, nargs="+", default=[5])
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[CHUNK_SIZE])
+    parser.add_argument("--chunk-overlap", type=int, nargs="+", default=[CHUNK_OVERLAP])
+    parser.add_argument("--embedding-model", nargs="+", default=[EMBEDDING_MODEL_NAME])
+    parser.add_argument("--prompt", nargs="+", default=["default"], choices=sorted(PROMPT_VARIANTS))
+    parser.add_argument("--llm", default="stub", choices=["stub", "local", "groq"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", help="Write the full results as JSON to this file")
+    parser.add_argument("--index-dir", default=EVAL_INDEX_DIR, help="Directory for the cached evaluation indexes")
+    parser.add_argument("--clean", action="store_true", help="Delete cached evaluation indexes before running")
+    args = parser.parse_args()
+
+    items = load_dataset(args.dataset)
+    grid = config_grid(args.k, args.chunk_size, args.chunk_overlap, args.embedding_model, args.prompt)
+    print(f"[Eval] {len(items)} questions x {len(grid)} configurations, LLM: {args.llm}")
+
+    if args.clean:
+        clean_indexes(args.index_dir)
+
+    started = time.perf_counter()
+    results, indexes = run_grid(items, grid, args.corpus, llm_kind=args.llm, workers=args.workers, index_dir=args.index_dir)
+    print(format_table(results))
+    print(f"\n[Eval] Done in {time.perf_counter() - started:.1f}s; OCR cache hits: {indexes.ocr_cache_hits}/{indexes.ocr_pages} pages")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
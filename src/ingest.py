@@ -1,36 +1,82 @@
 import os
 import pdfplumber
-import pytesseract
 from PIL import Image
-from typing import List, Tuple, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 import io
+from src.ocr import ocr_pdf_page, ocr_image
 
-def extract_text_from_pdf(file_stream) -> str:
-    """Extracts text from a PDF file stream."""
-    text = ""
-    try:
-        with pdfplumber.open(file_stream) as pdf:
-            for page in pdf.pages:
+IMAGE_TYPES = ['png', 'jpg', 'jpeg', 'tiff', 'bmp']
+
+def _release_page(page):
+    """Drops the parsed objects pdfplumber caches on a page (chars, images, layout)."""
+    close = getattr(page, "close", None) or page.flush_cache
+    close()
+
+def iter_pdf_pages(pdf_source, label: str, max_pages: int = 0) -> Iterator[Tuple[int, int, str, Optional[Dict]]]:
+    """
+    Yields (page_number, page_count, text, ocr_stats) one page at a time, falling
+    back to OCR for pages without a text layer. ocr_stats is None for pages that
+    were not OCR'd (or whose OCR failed, in which case text is empty).
+    Each page is released before the next one is read, so memory stays flat
+    however long the PDF is. Stops after max_pages pages (0 = no limit).
+    """
+    with pdfplumber.open(pdf_source) as pdf:
+        page_count = len(pdf.pages)
+        for page_number, page in enumerate(pdf.pages, start=1):
+            if max_pages and page_number > max_pages:
+                break
+            stats = None
+            try:
                 page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-                else:
-                    # Fallback to OCR for uploaded stream
+                if not page_text:
+                    # Fallback to OCR (scanned PDF)
                     try:
-                        im = page.to_image(resolution=300).original
-                        text += pytesseract.image_to_string(im) + "\n"
+                        page_text, stats = ocr_pdf_page(page)
                     except Exception as e:
-                        print(f"OCR failed for uploaded PDF page: {e}")
+                        print(f"OCR failed for page {page_number} in {label}: {e}")
+            finally:
+                _release_page(page)
+            yield page_number, page_count, page_text or "", stats
+
+def _extract_pdf(pdf_source, label: str) -> Tuple[str, List[Dict]]:
+    """
+    Extracts text from a PDF path or stream, falling back to OCR for pages
+    without a text layer.
+    Returns (text, ocr_pages) where each ocr_pages entry records the page number,
+    its [start, end) character span in the text and the OCR stats for that page.
+    """
+    parts = []
+    length = 0
+    ocr_pages = []
+    for page_number, _, page_text, stats in iter_pdf_pages(pdf_source, label):
+        start = length
+        if page_text:
+            parts.append(page_text + "\n")
+            length += len(page_text) + 1
+        if stats is not None:
+            stats.update({"page": page_number, "start": start, "end": length})
+            ocr_pages.append(stats)
+    return "".join(parts), ocr_pages
+
+def extract_text_from_pdf(file_stream) -> str:
+    """Extracts text from a PDF file stream."""
+    try:
+        text, _ = _extract_pdf(file_stream, "uploaded PDF")
     except Exception as e:
         print(f"Error reading PDF: {e}")
         return ""
     return text
 
+def _extract_image(image_source) -> Tuple[str, List[Dict]]:
+    image = Image.open(image_source)
+    text, stats = ocr_image(image)
+    stats.update({"page": 1, "start": 0, "end": len(text)})
+    return text, [stats]
+
 def extract_text_from_image(file_stream) -> str:
     """Extracts text from an image file stream using OCR."""
     try:
-        image = Image.open(file_stream)
-        text = pytesseract.image_to_string(image)
+        text, _ = _extract_image(file_stream)
         return text
     except Exception as e:
         print(f"Error processing image OCR: {e}")
@@ -50,64 +96,93 @@ def extract_text_from_txt(file_stream) -> str:
         print(f"Error reading text file: {e}")
         return ""
 
-def process_file(file_input, filename: str) -> str:
+def extract_file(file_input, filename: str) -> Tuple[str, List[Dict]]:
     """
     Generic processing function for both Streamlit uploads and local files.
     file_input: Can be a file path (str) or a file-like object.
+    Returns (text, ocr_pages); ocr_pages is empty when no OCR was needed.
     """
     file_type = filename.split('.')[-1].lower()
     text = ""
-    
+    ocr_pages = []
+
     # If file_input is a path string, open it
     if isinstance(file_input, str):
         if not os.path.exists(file_input):
-            return ""
-        
+            return "", []
+
         if file_type == 'pdf':
             # pdfplumber can open paths directly
-            with pdfplumber.open(file_input) as pdf:
-                for page in pdf.pages:
-                    t = page.extract_text()
-                    if t: 
-                        text += t + "\n"
-                    else:
-                        # Fallback to OCR if text extraction fails (scanned PDF)
-                        # Convert page to image
-                        try:
-                            im = page.to_image(resolution=300).original
-                            text += pytesseract.image_to_string(im) + "\n"
-                        except Exception as e:
-                            print(f"OCR failed for page in {file_input}: {e}")
-        elif file_type in ['png', 'jpg', 'jpeg', 'tiff', 'bmp']:
-            image = Image.open(file_input)
-            text = pytesseract.image_to_string(image)
+            text, ocr_pages = _extract_pdf(file_input, file_input)
+        elif file_type in IMAGE_TYPES:
+            text, ocr_pages = _extract_image(file_input)
         elif file_type == 'txt':
             with open(file_input, 'r', encoding='utf-8') as f:
                 text = f.read()
-                
+
     # If file_input is a file-like object (Streamlit)
     else:
         if file_type == 'pdf':
-            text = extract_text_from_pdf(file_input)
-        elif file_type in ['png', 'jpg', 'jpeg', 'tiff', 'bmp']:
-            text = extract_text_from_image(file_input)
+            try:
+                text, ocr_pages = _extract_pdf(file_input, filename)
+            except Exception as e:
+                print(f"Error reading PDF: {e}")
+        elif file_type in IMAGE_TYPES:
+            try:
+                text, ocr_pages = _extract_image(file_input)
+            except Exception as e:
+                print(f"Error processing image OCR: {e}")
         elif file_type == 'txt':
             text = extract_text_from_txt(file_input)
-            
+
+    return text, ocr_pages
+
+def iter_file_pages(file_input, filename: str, max_pages: int = 0) -> Iterator[Tuple[int, int, str, Optional[Dict]]]:
+    """
+    Streaming counterpart of extract_file: yields (page_number, page_count, text, ocr_stats)
+    per PDF page; images and text files are a single page.
+    Extraction errors are raised to the caller.
+    """
+    file_type = filename.split('.')[-1].lower()
+    if isinstance(file_input, str) and not os.path.exists(file_input):
+        return
+
+    if file_type == 'pdf':
+        yield from iter_pdf_pages(file_input, filename, max_pages)
+    elif file_type in IMAGE_TYPES:
+        image = Image.open(file_input)
+        text, stats = ocr_image(image)
+        yield 1, 1, text, stats
+    elif file_type == 'txt':
+        if isinstance(file_input, str):
+            with open(file_input, 'r', encoding='utf-8') as f:
+                text = f.read()
+        else:
+            text = extract_text_from_txt(file_input)
+        yield 1, 1, text, None
+
+def process_file(file_input, filename: str) -> str:
+    """
+    Generic processing function for both Streamlit uploads and local files.
+    file_input: Can be a file path (str) or a file-like object.
+    """
+    text, _ = extract_file(file_input, filename)
     return text
 
-def process_uploaded_file(uploaded_file) -> Tuple[str, str]:
+def process_uploaded_file(uploaded_file) -> Tuple[str, str, List[Dict]]:
     """
     Wrapper for Streamlit uploads.
+    Returns (filename, text, ocr_pages).
     """
     filename = uploaded_file.name
-    text = process_file(uploaded_file, filename)
-    return filename, text
+    text, ocr_pages = extract_file(uploaded_file, filename)
+    return filename, text, ocr_pages
 
-def process_local_file(file_path: str) -> Tuple[str, str]:
+def process_local_file(file_path: str) -> Tuple[str, str, List[Dict]]:
     """
     Wrapper for local files.
+    Returns (filename, text, ocr_pages).
     """
     filename = os.path.basename(file_path)
-    text = process_file(file_path, filename)
-    return filename, text
+    text, ocr_pages = extract_file(file_path, filename)
+    return filename, text, ocr_pages
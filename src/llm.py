@@ -1,15 +1,38 @@
 import os
 import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from groq import Groq
 
+def extract_chunk_text(chunk) -> str:
+    """Returns the text carried by a streamed chunk (Groq objects or the dict fallbacks)."""
+    try:
+        if hasattr(chunk, 'choices') and len(chunk.choices) > 0:
+            return chunk.choices[0].delta.content or ""
+        if isinstance(chunk, dict) and chunk.get('choices'):
+            choice = chunk['choices'][0]
+            if 'delta' in choice:
+                return choice['delta'].get('content') or ""
+            return choice.get('text') or ""
+    except Exception as e:
+        print(f"Error parsing chunk: {e}")
+    return ""
+
 class LLMEngine:
     def __init__(self):
         self.api_key = os.getenv("GROQ_API_KEY")
         self.client = None
         self.model = "llama-3.1-8b-instant"  # Updated to latest supported model
+        self._lock = threading.Lock()
+        self._warm_future: Future = None
+        self._executor = None
         
-    def load_model(self, api_key: str = None):
-        """Initializes the Groq client."""
+    def load_model(self, api_key: str = None, verify: bool = True):
+        """
+        Initializes the Groq client.
+        verify: Probe the API with models.list(); this also opens the HTTPS connection
+        that the first completion request then reuses.
+        """
         if api_key:
             self.api_key = api_key
             
@@ -18,20 +41,47 @@ class LLMEngine:
             
         try:
             self.client = Groq(api_key=self.api_key)
-            # Test connection
-            self.client.models.list()
+            if verify:
+                # Test connection
+                self.client.models.list()
             print("✅ Groq client initialized successfully")
         except Exception as e:
             print(f"Error initializing Groq client: {e}")
             self.client = None
             raise e
 
+    def warm_up(self, api_key: str = None) -> Future:
+        """
+        Starts client creation and connection setup in the background so it
+        overlaps with retrieval. Safe to call repeatedly; returns the pending future.
+        """
+        with self._lock:
+            if self._warm_future is not None and (not self._warm_future.done() or self.client is not None):
+                return self._warm_future
+            if api_key:
+                self.api_key = api_key
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-warmup")
+            self._warm_future = self._executor.submit(self.load_model)
+            return self._warm_future
+
+    def ensure_ready(self):
+        """Waits for a pending warm-up, or initializes the client synchronously."""
+        future = self._warm_future
+        if future is not None:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"LLM warm-up failed, retrying: {e}")
+        if not self.client:
+            self.load_model(verify=False)
+
     def generate_response(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.2, stream: bool = False):
         """
         Generates a response using Groq API.
         """
         if not self.client:
-            self.load_model()
+            self.ensure_ready()
             
         try:
             # Groq uses standard chat format, but we are passing a pre-constructed prompt.
@@ -0,0 +1,48 @@
+import threading
+from collections import deque
+from typing import Dict
+
+
+class Metrics:
+    """Thread-safe counters and recent timing samples (e.g. time-to-first-token)."""
+
+    def __init__(self, window: int = 100):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._samples: Dict[str, deque] = {}
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.window)
+            self._samples[name].append(value)
+
+    def count(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def summary(self, name: str) -> Dict[str, float]:
+        """Returns count, last, mean and p50/p95 of the recent samples of a timing."""
+        with self._lock:
+            values = list(self._samples.get(name, ()))
+        if not values:
+            return {"count": 0, "last": 0.0, "mean": 0.0, "p50": 0.0, "p95": 0.0}
+        ordered = sorted(values)
+        return {
+            "count": len(values),
+            "last": values[-1],
+            "mean": sum(values) / len(values),
+            "p50": ordered[len(ordered) // 2],
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        }
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Returns all counters and timing summaries."""
+        with self._lock:
+            counters = dict(self._counters)
+            names = list(self._samples)
+        return {"counters": counters, "timings": {name: self.summary(name) for name in names}}
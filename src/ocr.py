@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import pytesseract
+from PIL import Image
+
+from src.config import (
+    OCR_CACHE_DIR, OCR_PROBE_DPI, OCR_MIN_DPI, OCR_BASE_DPI, OCR_DENSE_DPI,
+    OCR_RETRY_DPI, OCR_MIN_CONFIDENCE, OCR_MAX_PIXELS, OCR_INK_THRESHOLD,
+    OCR_BLANK_INK_RATIO, OCR_DENSE_INK_RATIO, OCR_PSM_MODES
+)
+
+# Any change to the OCR settings invalidates previously cached results
+_SETTINGS_SIGNATURE = json.dumps([
+    OCR_PROBE_DPI, OCR_MIN_DPI, OCR_BASE_DPI, OCR_DENSE_DPI, OCR_RETRY_DPI,
+    OCR_MIN_CONFIDENCE, OCR_MAX_PIXELS, OCR_INK_THRESHOLD, OCR_BLANK_INK_RATIO,
+    OCR_DENSE_INK_RATIO, OCR_PSM_MODES
+]).encode("utf-8")
+
+
+def _empty_stats() -> Dict:
+    return {
+        "ocr_seconds": 0.0,
+        "ocr_confidence": 0.0,
+        "ocr_dpi": 0,
+        "ocr_psm": 0,
+        "ocr_cached": False,
+        "ocr_skipped": False,
+    }
+
+
+def ink_ratio(image: Image.Image) -> float:
+    """Returns the fraction of dark pixels in a downsampled grayscale copy of the image."""
+    gray = image.convert("L")
+    gray.thumbnail((512, 512))
+    histogram = gray.histogram()
+    total = sum(histogram)
+    if not total:
+        return 0.0
+    return sum(histogram[:OCR_INK_THRESHOLD]) / total
+
+
+def cap_dpi(width_pt: float, height_pt: float, dpi: int) -> int:
+    """Lowers dpi so that rendering a page of this size stays within OCR_MAX_PIXELS."""
+    area_in = (width_pt / 72.0) * (height_pt / 72.0)
+    if area_in > 0:
+        dpi = min(dpi, int((OCR_MAX_PIXELS / area_in) ** 0.5))
+    return dpi
+
+
+def choose_dpi(width_pt: float, height_pt: float, ink: float) -> int:
+    """
+    Picks the OCR resolution for a page.
+    Densely printed pages (usually small glyphs) get a higher DPI, and large
+    pages are capped so the raster never exceeds OCR_MAX_PIXELS.
+    """
+    dpi = OCR_DENSE_DPI if ink >= OCR_DENSE_INK_RATIO else OCR_BASE_DPI
+    return max(OCR_MIN_DPI, cap_dpi(width_pt, height_pt, dpi))
+
+
+def _page_has_no_objects(page) -> bool:
+    """True when pdfplumber finds nothing drawable on the page, so it need not be rendered."""
+    return not (page.chars or page.images or page.rects or page.curves or page.lines)
+
+
+def _image_digest(image: Image.Image) -> str:
+    h = hashlib.sha256()
+    h.update(_SETTINGS_SIGNATURE)
+    h.update(f"{image.mode}:{image.size}".encode("utf-8"))
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(OCR_CACHE_DIR, f"{key}.json")
+
+
+def _load_cached(key: str) -> Optional[Dict]:
+    try:
+        with open(_cache_path(key), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _store_cached(key: str, text: str, stats: Dict):
+    entry = {
+        "text": text,
+        "ocr_confidence": stats["ocr_confidence"],
+        "ocr_dpi": stats["ocr_dpi"],
+        "ocr_psm": stats["ocr_psm"],
+    }
+    tmp_path = _cache_path(key) + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, _cache_path(key))
+    except OSError as e:
+        print(f"[OCR] Could not write cache entry: {e}")
+
+
+def run_tesseract(image: Image.Image, psm: int) -> Tuple[str, float]:
+    """Runs Tesseract once and returns (text, mean word confidence)."""
+    data = pytesseract.image_to_data(
+        image,
+        config=f"--psm {psm}",
+        output_type=pytesseract.Output.DICT
+    )
+    lines = []
+    current_key = None
+    current_block = None
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        word = word.strip()
+        if not word:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if key != current_key:
+            if current_block is not None and key[0] != current_block:
+                lines.append("")
+            lines.append(word)
+            current_key = key
+            current_block = key[0]
+        else:
+            lines[-1] += " " + word
+        conf = float(data["conf"][i])
+        if conf >= 0:
+            confidences.append(conf)
+
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return "\n".join(lines), confidence
+
+
+def _ocr_with_retry(image: Image.Image, dpi: int, retry: Callable[[], Tuple[Optional[Image.Image], int]]) -> Tuple[str, Dict]:
+    """
+    OCRs the image with the primary PSM; if confidence is low, retries every
+    configured PSM on the higher-resolution image returned by `retry` and keeps the best.
+    """
+    stats = _empty_stats()
+    psm = OCR_PSM_MODES[0]
+    text, confidence = run_tesseract(image, psm)
+    best = (confidence, text, dpi, psm)
+
+    if confidence < OCR_MIN_CONFIDENCE:
+        retry_image, retry_dpi = retry()
+        if retry_image is None:
+            retry_image, retry_dpi = image, dpi
+        for retry_psm in OCR_PSM_MODES:
+            if retry_image is image and retry_psm == psm:
+                continue
+            text, confidence = run_tesseract(retry_image, retry_psm)
+            if confidence > best[0]:
+                best = (confidence, text, retry_dpi, retry_psm)
+
+    stats["ocr_confidence"] = round(best[0], 1)
+    stats["ocr_dpi"] = best[2]
+    stats["ocr_psm"] = best[3]
+    return best[1], stats
+
+
+def ocr_pdf_page(page) -> Tuple[str, Dict]:
+    """
+    OCRs a single pdfplumber page adaptively.
+    Blank pages are skipped, results are cached by the hash of a low-resolution
+    probe render, and the OCR resolution is chosen from page size and ink density.
+    Returns (text, stats) where stats holds timing, confidence, DPI and PSM.
+    """
+    start = time.perf_counter()
+
+    if _page_has_no_objects(page):
+        stats = _empty_stats()
+        stats["ocr_skipped"] = True
+        return "", stats
+
+    probe = page.to_image(resolution=OCR_PROBE_DPI).original
+    ink = ink_ratio(probe)
+    if ink < OCR_BLANK_INK_RATIO:
+        stats = _empty_stats()
+        stats["ocr_skipped"] = True
+        stats["ocr_seconds"] = round(time.perf_counter() - start, 3)
+        return "", stats
+
+    key = _image_digest(probe)
+    cached = _load_cached(key)
+    if cached is not None:
+        stats = _empty_stats()
+        stats.update({k: v for k, v in cached.items() if k != "text"})
+        stats["ocr_cached"] = True
+        stats["ocr_seconds"] = round(time.perf_counter() - start, 3)
+        return cached["text"], stats
+
+    dpi = choose_dpi(page.width, page.height, ink)
+    image = page.to_image(resolution=dpi).original
+
+    def retry():
+        # The retry raster obeys the same pixel cap; if that leaves no headroom, only the PSM changes
+        retry_dpi = cap_dpi(page.width, page.height, OCR_RETRY_DPI)
+        if retry_dpi <= dpi:
+            return None, dpi
+        return page.to_image(resolution=retry_dpi).original, retry_dpi
+
+    text, stats = _ocr_with_retry(image, dpi, retry)
+    _store_cached(key, text, stats)
+    stats["ocr_seconds"] = round(time.perf_counter() - start, 3)
+    return text, stats
+
+
+def ocr_image(image: Image.Image) -> Tuple[str, Dict]:
+    """
+    OCRs an uploaded image. Images larger than OCR_MAX_PIXELS are downscaled
+    first; a low-confidence retry only tries the other PSMs, since going back
+    to the full-resolution original would break the pixel cap.
+    """
+    start = time.perf_counter()
+
+    key = _image_digest(image)
+    cached = _load_cached(key)
+    if cached is not None:
+        stats = _empty_stats()
+        stats.update({k: v for k, v in cached.items() if k != "text"})
+        stats["ocr_cached"] = True
+        stats["ocr_seconds"] = round(time.perf_counter() - start, 3)
+        return cached["text"], stats
+
+    if ink_ratio(image) < OCR_BLANK_INK_RATIO:
+        stats = _empty_stats()
+        stats["ocr_skipped"] = True
+        stats["ocr_seconds"] = round(time.perf_counter() - start, 3)
+        return "", stats
+
+    dpi_info = image.info.get("dpi")
+    dpi = int(dpi_info[0]) if dpi_info else 0
+    working = image
+    pixels = image.width * image.height
+    if pixels > OCR_MAX_PIXELS:
+        scale = (OCR_MAX_PIXELS / pixels) ** 0.5
+        working = image.resize((int(image.width * scale), int(image.height * scale)), Image.LANCZOS)
+        dpi = int(dpi * scale)
+
+    def retry():
+        return None, dpi
+
+    text, stats = _ocr_with_retry(working, dpi, retry)
+    _store_cached(key, text, stats)
+    stats["ocr_seconds"] = round(time.perf_counter() - start, 3)
+    return text, stats
@@ -16,11 +16,28 @@ IMPORTANT RULES:
 
 """
 
-def construct_rag_prompt(query: str, context_text: str) -> str:
+def construct_rag_prompt(query: str, context_text: str, history_text: str = "", system_prompt: str = SYSTEM_PROMPT) -> str:
     """Constructs the final prompt for the LLM using Phi-3 chat format."""
+    history = f"Conversation so far:\n{history_text}\n\n" if history_text else ""
     return (
-        f"System:\n{SYSTEM_PROMPT}\n\n"
+        f"System:\n{system_prompt}\n\n"
         f"Context:\n{context_text}\n\n"
+        f"{history}"
         f"User: {query}\n\n"
         f"Assistant:"
     )
+
+# Prompt for turning a follow-up question into a standalone search query
+REWRITE_PROMPT = """Rewrite the follow-up question so it can be understood without the conversation.
+Keep it short, keep the names of papers, methods and terms it refers to, and output only the rewritten question.
+
+"""
+
+def construct_rewrite_prompt(query: str, history_text: str) -> str:
+    """Constructs the prompt used to rewrite a follow-up into a standalone question."""
+    return (
+        f"System:\n{REWRITE_PROMPT}"
+        f"Conversation:\n{history_text}\n\n"
+        f"Follow-up question: {query}\n\n"
+        f"Standalone question:"
+    )
@@ -1,37 +1,229 @@
+import threading
+import time
+from concurrent.futures import Future
 from typing import List, Dict
 from src.vector_store import VectorStoreManager
-from src.llm import LLMEngine
-from src.prompts import construct_rag_prompt
+from src.llm import LLMEngine, extract_chunk_text
+from src.metrics import Metrics
+from src.prompts import SYSTEM_PROMPT, construct_rag_prompt, construct_rewrite_prompt
+from src.conversation import ConversationState, is_follow_up, can_reuse_context
+from src.streaming import CancelToken
+from src.config import CONTEXT_EXPANSION_WINDOW, CONVERSATION_LLM_REWRITE, SPECULATIVE_DEBOUNCE_SECONDS, TENANT_LLM_WAIT_SECONDS
 
 class RAGPipeline:
-    def __init__(self):
-        self.vector_store = VectorStoreManager()
+    def __init__(self, vector_store: VectorStoreManager = None, llm_slots: threading.Semaphore = None):
+        """
+        vector_store: Existing VectorStoreManager to share (avoids loading the embedding model twice)
+        llm_slots: Optional semaphore capping concurrent LLM calls (per-workspace quota)
+        """
+        self.vector_store = vector_store or VectorStoreManager()
         self.llm_engine = LLMEngine()
-        
+        self.llm_slots = llm_slots
+        self.system_prompt = SYSTEM_PROMPT
+        self.metrics = Metrics()
+        self._speculation_lock = threading.Lock()
+        self._speculation_timer = None
+        self._speculation = None  # (key, chunk store generation, Future) of the latest speculative retrieval
+
+    @staticmethod
+    def _speculation_key(query: str, k: int, source_filter: List[str], expand: int):
+        return (query.strip(), k, tuple(source_filter or ()), expand)
+
+    def _search_ids(self, query: str, k: int, source_filter: List[str], expand: int) -> List[int]:
+        started = time.perf_counter()
+        ids = self.vector_store.query_ids(query, k=k, source_filter=source_filter)
+        if expand:
+            ids = self.vector_store.chunk_store.expand(ids, expand)
+        self.metrics.observe("retrieval_seconds", time.perf_counter() - started)
+        return ids
+
+    def prefetch_context(self, query: str, k: int = 5, source_filter: List[str] = None, expand: int = CONTEXT_EXPANSION_WINDOW,
+                         debounce: float = SPECULATIVE_DEBOUNCE_SECONDS):
+        """
+        Speculatively retrieves context for a draft query (e.g. while the user types).
+        Calls are debounced; if the submitted query matches the last draft,
+        retrieve_ids returns the prefetched IDs instead of searching again.
+        """
+        if not query.strip():
+            return
+        key = self._speculation_key(query, k, source_filter, expand)
+
+        def run():
+            future = Future()
+            with self._speculation_lock:
+                # A newer draft or the submitted query has superseded this timer after it fired
+                if self._speculation_timer is not timer:
+                    return
+                self._speculation_timer = None
+                self._speculation = (key, self.vector_store.chunk_store.generation, future)
+            try:
+                future.set_result(self._search_ids(query, k, source_filter, expand))
+            except Exception as e:
+                future.set_exception(e)
+
+        with self._speculation_lock:
+            if self._speculation_timer is not None:
+                self._speculation_timer.cancel()
+            timer = threading.Timer(debounce, run)
+            timer.daemon = True
+            self._speculation_timer = timer
+            timer.start()
+
+    def retrieve_ids(self, query: str, k: int = 5, source_filter: List[str] = None, expand: int = CONTEXT_EXPANSION_WINDOW) -> List[int]:
+        """
+        Retrieves chunk-store IDs for the query.
+        expand: Number of neighbouring chunks to add on each side of every hit.
+        """
+        key = self._speculation_key(query, k, source_filter, expand)
+        with self._speculation_lock:
+            # The query was submitted, so any draft still waiting on its debounce is obsolete
+            if self._speculation_timer is not None:
+                self._speculation_timer.cancel()
+                self._speculation_timer = None
+            speculation, self._speculation = self._speculation, None
+
+        if speculation is not None and speculation[0] == key:
+            try:
+                ids = speculation[2].result()
+                # Documents re-uploaded or deleted (or the store reset) since the prefetch invalidate its IDs
+                store = self.vector_store.chunk_store
+                if speculation[1] == store.generation and all(store.is_live(i) for i in ids):
+                    self.metrics.increment("speculative_hits")
+                    return ids
+            except Exception as e:
+                print(f"[RAG] Speculative retrieval failed, searching again: {e}")
+        return self._search_ids(query, k, source_filter, expand)
+
+    def _acquire_llm_slot(self, cancel_token: CancelToken = None) -> bool:
+        if self.llm_slots is None:
+            return True
+        deadline = time.perf_counter() + TENANT_LLM_WAIT_SECONDS
+        # Wait in short steps so a cancelled request gives up its place in the queue
+        while not (cancel_token and cancel_token.cancelled):
+            if self.llm_slots.acquire(timeout=min(0.2, max(0.0, deadline - time.perf_counter()))):
+                return True
+            if time.perf_counter() >= deadline:
+                self.metrics.increment("llm_quota_rejections")
+                return False
+        return False
+
+    def _release_llm_slot(self):
+        if self.llm_slots is not None:
+            self.llm_slots.release()
+
+    def _generate_stream(self, prompt: str, started: float, cancel_token: CancelToken = None):
+        """
+        Holds an LLM slot for the whole stream and releases it when the stream ends or is closed.
+        The upstream stream is registered on cancel_token, so cancelling closes it directly;
+        nothing is requested at all if the token is cancelled before a slot is free.
+        """
+        if cancel_token and cancel_token.cancelled:
+            return
+        if not self._acquire_llm_slot(cancel_token):
+            if not (cancel_token and cancel_token.cancelled):
+                yield {'choices': [{'text': "Too many requests are running in this workspace. Please try again shortly."}]}
+            return
+        try:
+            if cancel_token and cancel_token.cancelled:
+                return
+            stream = self.llm_engine.generate_response(prompt, stream=True)
+            if cancel_token and not cancel_token.register(stream):
+                return
+            yield from self._track_stream(stream, started)
+        except Exception as e:
+            yield {'choices': [{'text': f"Error: {str(e)}"}]}
+        finally:
+            self._release_llm_slot()
+
+    def _track_stream(self, stream, started: float):
+        """Passes the stream through, recording time-to-first-token and total generation time."""
+        first_token = True
+        try:
+            for chunk in stream:
+                if first_token and extract_chunk_text(chunk):
+                    first_token = False
+                    self.metrics.observe("ttft_seconds", time.perf_counter() - started)
+                yield chunk
+            self.metrics.observe("answer_seconds", time.perf_counter() - started)
+        finally:
+            # Closing this generator early also closes the upstream HTTP stream
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+
     def get_context(self, query: str, k: int = 5) -> List[str]:
         """Retrieves relevant chunks from the vector store."""
-        docs = self.vector_store.query_similarity(query, k=k)
-        return [doc.page_content for doc in docs]
+        return self.vector_store.chunk_store.texts(self.retrieve_ids(query, k=k))
 
-    def construct_prompt(self, query: str, context_chunks: List[str]) -> str:
+    def construct_prompt(self, query: str, context_chunks: List[str], history_text: str = "") -> str:
         """Constructs the prompt for Phi-3."""
         context_text = "\n\n".join(context_chunks)
-        return construct_rag_prompt(query, context_text)
+        return construct_rag_prompt(query, context_text, history_text, self.system_prompt)
 
-    def answer_question(self, query: str, k: int = 5, source_filter: List[str] = None) -> Dict:
+    def rewrite_query(self, query: str, conversation: ConversationState, use_llm: bool = CONVERSATION_LLM_REWRITE) -> str:
+        """
+        Turns a follow-up question into a standalone query for retrieval.
+        Questions that are not follow-ups are returned unchanged.
+        """
+        last = conversation.last_turn
+        if last is None or not is_follow_up(query):
+            return query
+
+        if use_llm:
+            try:
+                rewritten = self.llm_engine.generate_response(
+                    construct_rewrite_prompt(query, conversation.history_text()),
+                    max_tokens=64,
+                    temperature=0.0
+                ).strip().strip('"')
+                if rewritten and not rewritten.startswith("Error generating response"):
+                    return rewritten
+            except Exception as e:
+                print(f"[RAG] Query rewrite failed, falling back to heuristic: {e}")
+
+        # Anchor the follow-up to the previous standalone question
+        return f"{query} ({last.standalone_query[:300]})"
+
+    def _retrieve_for_turn(self, query: str, k: int, source_filter: List[str], expand: int, conversation: ConversationState) -> List[int]:
+        """
+        Conversation-aware retrieval.
+        Follow-ups that introduce no new topic terms and keep the same source
+        filter reuse the previous turn's chunks without searching again;
+        other follow-ups are rewritten into standalone form before retrieval.
+        The turn is recorded on the conversation.
+        """
+        last = conversation.last_turn
+        store = self.vector_store.chunk_store
+        if can_reuse_context(last, query, source_filter, store):
+            standalone = self.rewrite_query(query, conversation, use_llm=False)
+            conversation.start_turn(query, standalone, last.chunk_ids, last.sources, reused_context=True,
+                                    store_generation=store.generation, source_filter=source_filter)
+            print(f"[RAG] Follow-up reuses {len(last.chunk_ids)} chunks from the previous turn")
+            return last.chunk_ids
+
+        standalone = self.rewrite_query(query, conversation)
+        ids = self.retrieve_ids(standalone, k=k, source_filter=source_filter, expand=expand)
+        conversation.start_turn(query, standalone, ids, store.sources_of(ids), store_generation=store.generation,
+                                source_filter=source_filter)
+        return ids
+
+    def answer_question(self, query: str, k: int = 5, source_filter: List[str] = None, expand: int = CONTEXT_EXPANSION_WINDOW,
+                        conversation: ConversationState = None) -> Dict:
         """
         End-to-end RAG pipeline: Retrieve -> Generate.
         Returns dictionary with answer and source context.
         source_filter: Optional list of filenames to restrict search to
+        conversation: Optional chat state; enables follow-up rewriting, context reuse and history
         """
         # 1. Retrieve
-        if source_filter:
-            docs = self.vector_store.query_similarity_filtered(query, source_filter=source_filter, k=k)
+        history_text = conversation.history_text() if conversation else ""
+        if conversation:
+            ids = self._retrieve_for_turn(query, k, source_filter, expand, conversation)
         else:
-            docs = self.vector_store.query_similarity(query, k=k)
-        context_chunks = [doc.page_content for doc in docs]
-        sources = list(set([doc.metadata.get('source', 'unknown') for doc in docs]))
-        
+            ids = self.retrieve_ids(query, k=k, source_filter=source_filter, expand=expand)
+        context_chunks = self.vector_store.chunk_store.texts(ids)
+        sources = self.vector_store.chunk_store.sources_of(ids)
+
         if not context_chunks:
             return {
                 "answer": "No relevant documents found in the knowledge base.",
@@ -39,9 +231,14 @@ class RAGPipeline:
             }
 
         # 2. Construct Prompt
-        prompt = self.construct_prompt(query, context_chunks)
-        
+        prompt = self.construct_prompt(query, context_chunks, history_text)
+
         # 3. Generate
+        if not self._acquire_llm_slot():
+            return {
+                "answer": "Too many requests are running in this workspace. Please try again shortly.",
+                "sources": []
+            }
         try:
             response = self.llm_engine.generate_response(prompt)
         except FileNotFoundError:
@@ -54,26 +251,42 @@ class RAGPipeline:
                 "answer": f"Error generating response: {str(e)}",
                 "sources": []
             }
-            
+        finally:
+            self._release_llm_slot()
+
+        if conversation:
+            conversation.record_answer(response)
+
         return {
             "answer": response,
             "sources": sources,
             "context": context_chunks # Optional: return context for debugging
         }
 
-    def answer_question_stream(self, query: str, k: int = 5, source_filter: List[str] = None):
+    def answer_question_stream(self, query: str, k: int = 5, source_filter: List[str] = None, expand: int = CONTEXT_EXPANSION_WINDOW,
+                               conversation: ConversationState = None, cancel_token: CancelToken = None):
         """
         Streams the answer. Returns (generator, sources).
         source_filter: Optional list of filenames to restrict search to
+        conversation: Optional chat state; call conversation.record_answer() once the stream is consumed
+        cancel_token: Optional token (shared with the StreamWorker) that aborts the upstream request when cancelled
         """
+        started = time.perf_counter()
+        # Open the LLM connection in the background while retrieval runs
+        try:
+            self.llm_engine.warm_up()
+        except Exception as e:
+            print(f"[RAG] Could not start LLM warm-up: {e}")
+
         # 1. Retrieve
-        if source_filter:
-            docs = self.vector_store.query_similarity_filtered(query, source_filter=source_filter, k=k)
+        history_text = conversation.history_text() if conversation else ""
+        if conversation:
+            ids = self._retrieve_for_turn(query, k, source_filter, expand, conversation)
         else:
-            docs = self.vector_store.query_similarity(query, k=k)
-        context_chunks = [doc.page_content for doc in docs]
-        sources = list(set([doc.metadata.get('source', 'unknown') for doc in docs]))
-        
+            ids = self.retrieve_ids(query, k=k, source_filter=source_filter, expand=expand)
+        context_chunks = self.vector_store.chunk_store.texts(ids)
+        sources = self.vector_store.chunk_store.sources_of(ids)
+
         if not context_chunks:
             # Return a dummy generator
             def empty_gen():
@@ -81,13 +294,7 @@ class RAGPipeline:
             return empty_gen(), []
 
         # 2. Construct Prompt
-        prompt = self.construct_prompt(query, context_chunks)
-        
-        # 3. Generate Stream
-        try:
-            stream = self.llm_engine.generate_response(prompt, stream=True)
-            return stream, sources
-        except Exception as e:
-            def error_gen():
-                yield {'choices': [{'text': f"Error: {str(e)}"}]}
-            return error_gen(), []
+        prompt = self.construct_prompt(query, context_chunks, history_text)
+
+        # 3. Generate Stream (the request is opened once the caller starts consuming it)
+        return self._generate_stream(prompt, started, cancel_token), sources
@@ -0,0 +1,296 @@
+"""
+Resource governor for the ingest path.
+
+Ingest runs as two stages joined by a bounded queue: a producer thread extracts
+(and OCRs) pages one at a time, and the calling thread chunks, embeds and stores
+them in batches. When indexing falls behind, the queue fills and extraction
+blocks, so at most `inflight_pages` pages are held in memory. Concurrent ingests
+across all sessions share a fixed number of worker slots, and extraction pauses
+while the process is short of memory. Large uploads get slower instead of
+getting the process OOM-killed.
+
+psutil is used for memory and CPU figures when installed; otherwise they are
+read from /proc and the cgroup (container) memory limit.
+"""
+import gc
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from src.config import (
+    INGEST_MAX_FILE_MB, INGEST_MAX_PAGES, INGEST_MAX_WORKERS, INGEST_MAX_INFLIGHT_PAGES, INGEST_WORKER_MEMORY_MB,
+    INGEST_PAGE_MEMORY_MB, INGEST_CHUNK_BATCH, INGEST_MIN_FREE_MEMORY_MB, INGEST_MEMORY_WAIT_SECONDS
+)
+from src.ingest import iter_file_pages
+
+_MB = 1024 * 1024
+_DONE = object()
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path, "r") as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def _cgroup_available_mb() -> Optional[float]:
+    """Room left under the container's memory limit (cgroup v2, then v1), if there is one."""
+    for limit_path, usage_path in (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+    ):
+        limit, usage = _read_int(limit_path), _read_int(usage_path)
+        # v1 reports "no limit" as a huge number
+        if limit is not None and usage is not None and limit < 1 << 60:
+            return max(0, limit - usage) / _MB
+    return None
+
+
+def available_memory_mb() -> Optional[float]:
+    """Memory the process can still use: the lower of the host's and the container's headroom."""
+    host = None
+    if psutil is not None:
+        host = psutil.virtual_memory().available / _MB
+    else:
+        try:
+            with open("/proc/meminfo", "r") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        host = int(line.split()[1]) / 1024
+                        break
+        except OSError:
+            pass
+    container = _cgroup_available_mb()
+    values = [v for v in (host, container) if v is not None]
+    return min(values) if values else None
+
+
+def rss_mb() -> Optional[float]:
+    """Resident set size of this process."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / _MB
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / _MB
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class ResourceSampler:
+    """Samples RSS and process CPU usage (percent of one core, as in top) since the previous sample."""
+
+    def __init__(self):
+        self._last_wall = time.perf_counter()
+        self._last_cpu = self._cpu_seconds()
+        self.peak_rss_mb = 0.0
+
+    @staticmethod
+    def _cpu_seconds() -> float:
+        times = os.times()
+        return times.user + times.system
+
+    def sample(self) -> Dict:
+        now, cpu = time.perf_counter(), self._cpu_seconds()
+        wall = now - self._last_wall
+        cpu_percent = 100.0 * (cpu - self._last_cpu) / wall if wall > 0 else 0.0
+        self._last_wall, self._last_cpu = now, cpu
+        rss = rss_mb()
+        if rss is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb, rss)
+        return {"rss_mb": rss, "cpu_percent": cpu_percent, "available_mb": available_memory_mb()}
+
+
+class IngestLimits:
+    __slots__ = ("workers", "inflight_pages", "chunk_batch", "max_file_mb", "max_pages", "min_free_mb")
+
+    def __init__(self, workers: int, inflight_pages: int, chunk_batch: int, max_file_mb: float = INGEST_MAX_FILE_MB,
+                 max_pages: int = INGEST_MAX_PAGES, min_free_mb: float = INGEST_MIN_FREE_MEMORY_MB):
+        self.workers = workers
+        self.inflight_pages = inflight_pages
+        self.chunk_batch = chunk_batch
+        self.max_file_mb = max_file_mb
+        self.max_pages = max_pages
+        self.min_free_mb = min_free_mb
+
+
+def derive_limits() -> IngestLimits:
+    """Ingest caps from config, with the unset (0) ones derived from cores and available memory."""
+    cores = os.cpu_count() or 1
+    available = available_memory_mb()
+    budget = max(0.0, available - INGEST_MIN_FREE_MEMORY_MB) if available is not None else None
+
+    workers = INGEST_MAX_WORKERS
+    if not workers:
+        workers = max(1, cores // 2)
+        if budget is not None:
+            workers = max(1, min(workers, int(budget // INGEST_WORKER_MEMORY_MB)))
+
+    inflight_pages = INGEST_MAX_INFLIGHT_PAGES
+    if not inflight_pages:
+        inflight_pages = 8
+        if budget is not None:
+            inflight_pages = max(1, min(16, int(budget / workers // INGEST_PAGE_MEMORY_MB)))
+
+    chunk_batch = INGEST_CHUNK_BATCH
+    if budget is not None and budget < workers * INGEST_WORKER_MEMORY_MB:
+        chunk_batch = max(8, chunk_batch // 2)
+
+    limits = IngestLimits(workers, inflight_pages, chunk_batch)
+    print(f"[Resources] Ingest limits: {workers} worker(s), {inflight_pages} page(s) in flight, "
+          f"{chunk_batch} chunks per batch (available memory: {available if available is None else round(available)} MB)")
+    return limits
+
+
+def _input_size_mb(file_input) -> float:
+    if isinstance(file_input, str):
+        return os.path.getsize(file_input) / _MB if os.path.exists(file_input) else 0.0
+    size = getattr(file_input, "size", None)
+    if size is None:
+        position = file_input.tell()
+        size = file_input.seek(0, os.SEEK_END)
+        file_input.seek(position)
+    return size / _MB
+
+
+class IngestGovernor:
+    """
+    Runs ingests under the process-wide limits. Use ingest() instead of
+    extract_file() + add_document() for anything that may be large.
+    """
+
+    def __init__(self, limits: IngestLimits = None):
+        self.limits = limits or derive_limits()
+        self._slots = threading.BoundedSemaphore(self.limits.workers)
+
+    def wait_for_memory(self, stop: threading.Event = None) -> float:
+        """Pauses while available memory is below the floor (bounded wait). Returns the seconds waited."""
+        available = available_memory_mb()
+        if available is None or available >= self.limits.min_free_mb:
+            return 0.0
+        started = time.perf_counter()
+        print(f"[Resources] Low memory ({available:.0f} MB available), pausing extraction")
+        while time.perf_counter() - started < INGEST_MEMORY_WAIT_SECONDS:
+            gc.collect()
+            if stop is not None and stop.wait(0.5):
+                break
+            if stop is None:
+                time.sleep(0.5)
+            available = available_memory_mb()
+            if available is None or available >= self.limits.min_free_mb:
+                break
+        return time.perf_counter() - started
+
+    def _put(self, pages: queue.Queue, item, stop: threading.Event) -> bool:
+        """Blocks while the queue is full (backpressure) unless the consumer has stopped."""
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _extract(self, file_input, filename: str, pages: queue.Queue, stop: threading.Event):
+        try:
+            for item in iter_file_pages(file_input, filename, self.limits.max_pages):
+                if not self._put(pages, item, stop):
+                    return
+                self.wait_for_memory(stop)
+        except Exception as e:
+            print(f"[Resources] Extraction of {filename} failed: {e}")
+            self._put(pages, e, stop)
+        finally:
+            self._put(pages, _DONE, stop)
+
+    def ingest(self, vector_store, file_input, filename: str, on_progress: Callable[[Dict], None] = None) -> Dict:
+        """
+        Extracts and indexes one file into a VectorStoreManager with bounded memory.
+        on_progress: Called (on the calling thread) after every page and batch with
+        the report so far plus a stage name and fresh RSS/CPU samples.
+        Returns a report: pages read / page_count, chunks, ocr_pages, seconds,
+        peak_rss_mb and truncated (why only part of the file was ingested, or None).
+        Raises ValueError if the file is over the size limit or the workspace quota
+        leaves no room.
+        """
+        limits = self.limits
+        size_mb = _input_size_mb(file_input)
+        if limits.max_file_mb and size_mb > limits.max_file_mb:
+            raise ValueError(f"{filename} is {size_mb:.0f} MB; files over {limits.max_file_mb} MB are not ingested.")
+
+        report = {"filename": filename, "pages": 0, "page_count": 0, "chunks": 0, "ocr_pages": 0,
+                  "seconds": 0.0, "peak_rss_mb": 0.0, "truncated": None}
+        sampler = ResourceSampler()
+        started = time.perf_counter()
+
+        def progress(stage: str):
+            if on_progress:
+                on_progress(dict(report, stage=stage, **sampler.sample()))
+
+        progress("waiting for a worker")
+        self._slots.acquire()
+        pages = queue.Queue(maxsize=limits.inflight_pages)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._extract, args=(file_input, filename, pages, stop), name="ingest-extract", daemon=True)
+        try:
+            producer.start()
+
+            def page_stream():
+                while True:
+                    item = pages.get()
+                    if item is _DONE:
+                        return
+                    if isinstance(item, Exception):
+                        report["truncated"] = f"extraction stopped after page {report['pages']}: {item}"
+                        return
+                    page_number, page_count, text, stats = item
+                    report["pages"], report["page_count"] = page_number, page_count
+                    if stats is not None:
+                        report["ocr_pages"] += 1
+                    progress("extracting")
+                    yield page_number, text, stats
+
+            def on_batch(chunks: int):
+                report["chunks"] = chunks
+                progress("indexing")
+
+            report["chunks"], reason = vector_store.add_document_stream(
+                filename, page_stream(), batch_chunks=limits.chunk_batch, on_batch=on_batch
+            )
+            if reason:
+                report["truncated"] = f"{reason} after page {report['pages']}"
+            elif not report["truncated"] and report["pages"] < report["page_count"]:
+                report["truncated"] = f"page limit of {limits.max_pages} reached ({report['page_count']} pages in file)"
+        finally:
+            stop.set()
+            producer.join()
+            self._slots.release()
+            report["seconds"] = time.perf_counter() - started
+            sampler.sample()
+            report["peak_rss_mb"] = sampler.peak_rss_mb
+
+        if report["truncated"]:
+            print(f"[Resources] Partially ingested {filename}: {report['truncated']}")
+        return report
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor() -> IngestGovernor:
+    """Returns the process-wide ingest governor shared by all sessions."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = IngestGovernor()
+        return _governor
@@ -0,0 +1,231 @@
+"""
+Knowledge-base snapshots: streaming columnar export/import and compaction.
+
+A snapshot is a directory with:
+    manifest.json    embedding model, dimension, row count, vector encoding, sources
+    texts.bin        chunk texts, UTF-8, back to back
+    texts.idx        int64 (offset, length) per row into texts.bin
+    metadata.jsonl   one JSON object per row: Chroma id + chunk metadata
+    vectors.bin      float32 rows, or int8 rows when quantized
+    scales.bin       float32 per-row scale (quantized snapshots only)
+
+Importing writes the stored vectors straight into Chroma, so no OCR or
+re-embedding is needed on the receiving machine.
+
+Usage:
+    python -m src.snapshot export <dir> [--quantize]
+    python -m src.snapshot import <dir> [--replace]
+    python -m src.snapshot compact
+    (add --workspace <name> before the command to target a workspace other than the default)
+"""
+import argparse
+import json
+import mmap
+import os
+import time
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from src.config import COLLECTION_NAME, SNAPSHOT_BATCH_SIZE
+
+SNAPSHOT_VERSION = 1
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def export_snapshot(manager, path: str, quantize: bool = False, batch_size: int = SNAPSHOT_BATCH_SIZE) -> Dict:
+    """
+    Streams the collection behind a VectorStoreManager into a snapshot directory,
+    one batch at a time. Returns the manifest.
+    """
+    collection = manager.vector_db._collection
+    total = collection.count()
+    os.makedirs(path, exist_ok=True)
+    print(f"[Snapshot] Exporting {total} chunks to {path}")
+
+    dimension = 0
+    count = 0
+    text_offset = 0
+    sources = set()
+    started = time.perf_counter()
+
+    with open(os.path.join(path, "texts.bin"), "wb") as texts_file, \
+         open(os.path.join(path, "texts.idx"), "wb") as index_file, \
+         open(os.path.join(path, "metadata.jsonl"), "w", encoding="utf-8") as meta_file, \
+         open(os.path.join(path, "vectors.bin"), "wb") as vectors_file, \
+         open(os.path.join(path, "scales.bin"), "wb") as scales_file:
+        for offset in range(0, total, batch_size):
+            batch = collection.get(
+                limit=batch_size,
+                offset=offset,
+                include=["documents", "metadatas", "embeddings"]
+            )
+            if not batch["ids"]:
+                break
+
+            vectors = np.asarray(batch["embeddings"], dtype=np.float32)
+            dimension = vectors.shape[1]
+            if quantize:
+                quantized, scales = _quantize(vectors)
+                vectors_file.write(quantized.tobytes())
+                scales_file.write(scales.tobytes())
+            else:
+                vectors_file.write(vectors.tobytes())
+
+            spans = np.empty((len(batch["ids"]), 2), dtype=np.int64)
+            for i, (chunk_id, text, meta) in enumerate(zip(batch["ids"], batch["documents"], batch["metadatas"])):
+                data = text.encode("utf-8")
+                texts_file.write(data)
+                spans[i] = (text_offset, len(data))
+                text_offset += len(data)
+                meta_file.write(json.dumps({"id": chunk_id, "metadata": meta}) + "\n")
+                sources.add(meta.get("source", "unknown"))
+            index_file.write(spans.tobytes())
+            count += len(batch["ids"])
+
+    if not quantize:
+        os.remove(os.path.join(path, "scales.bin"))
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "embedding_model": manager.embedding_model_name,
+        "dimension": dimension,
+        "count": count,
+        "vector_dtype": "int8" if quantize else "float32",
+        "sources": sorted(sources),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"[Snapshot] Exported {count} chunks in {time.perf_counter() - started:.1f}s")
+    return manifest
+
+
+def read_manifest(path: str) -> Dict:
+    with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version: {manifest.get('version')}")
+    return manifest
+
+
+def iter_snapshot(path: str, batch_size: int = SNAPSHOT_BATCH_SIZE) -> Iterator[Tuple[List[str], List[str], List[Dict], np.ndarray]]:
+    """Yields (ids, texts, metadatas, float32 vectors) batches from a snapshot without loading it whole."""
+    manifest = read_manifest(path)
+    count = manifest["count"]
+    dimension = manifest["dimension"]
+    quantized = manifest["vector_dtype"] == "int8"
+    if not count:
+        return
+
+    spans = np.fromfile(os.path.join(path, "texts.idx"), dtype=np.int64).reshape(-1, 2)
+    vectors = np.memmap(
+        os.path.join(path, "vectors.bin"),
+        dtype=np.int8 if quantized else np.float32,
+        mode="r",
+        shape=(count, dimension)
+    )
+    scales = np.fromfile(os.path.join(path, "scales.bin"), dtype=np.float32) if quantized else None
+
+    with open(os.path.join(path, "texts.bin"), "rb") as texts_file, \
+         open(os.path.join(path, "metadata.jsonl"), "r", encoding="utf-8") as meta_file:
+        texts_map = mmap.mmap(texts_file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(texts_file.name) else b""
+        try:
+            for start in range(0, count, batch_size):
+                end = min(start + batch_size, count)
+                ids, metadatas = [], []
+                for _ in range(start, end):
+                    row = json.loads(meta_file.readline())
+                    ids.append(row["id"])
+                    metadatas.append(row["metadata"])
+                texts = [texts_map[o:o + n].decode("utf-8") for o, n in spans[start:end]]
+                batch_vectors = np.asarray(vectors[start:end], dtype=np.float32)
+                if quantized:
+                    batch_vectors *= scales[start:end, None]
+                yield ids, texts, metadatas, batch_vectors
+        finally:
+            if isinstance(texts_map, mmap.mmap):
+                texts_map.close()
+
+
+def import_snapshot(manager, path: str, replace: bool = False, batch_size: int = SNAPSHOT_BATCH_SIZE) -> int:
+    """
+    Loads a snapshot into the collection behind a VectorStoreManager using the
+    stored vectors (no re-embedding).
+    replace: Reset the collection first; otherwise only the snapshot's sources are replaced.
+    Returns the number of chunks imported.
+    """
+    manifest = read_manifest(path)
+    if manifest["embedding_model"] != manager.embedding_model_name:
+        raise ValueError(
+            f"Snapshot was built with '{manifest['embedding_model']}', "
+            f"but this knowledge base uses '{manager.embedding_model_name}'."
+        )
+
+    print(f"[Snapshot] Importing {manifest['count']} chunks from {path}")
+    started = time.perf_counter()
+    batches = ((ids, texts, metadatas, vectors.tolist()) for ids, texts, metadatas, vectors in iter_snapshot(path, batch_size=batch_size))
+    imported = manager.import_vectors(manifest["embedding_model"], manifest["sources"], manifest["count"], batches, replace=replace)
+    print(f"[Snapshot] Imported {imported} chunks in {time.perf_counter() - started:.1f}s")
+    return imported
+
+
+def compact(manager, batch_size: int = SNAPSHOT_BATCH_SIZE) -> Dict:
+    """
+    Rewrites the collection (and chunk store) without tombstones left by deletes
+    and re-uploads. The copy is built into a fresh collection while the workspace
+    stays fully usable, then swapped in atomically; see VectorStoreManager.compact_index.
+    Returns sizes before and after.
+    """
+    persist_directory = manager.persist_directory
+    before = _dir_size(persist_directory)
+    manager.compact_index(batch_size=batch_size)
+    after = _dir_size(persist_directory)
+    print(f"[Snapshot] Compacted {before} -> {after} bytes")
+    return {"bytes_before": before, "bytes_after": after}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export, import or compact the knowledge base.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_parser = sub.add_parser("export")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--quantize", action="store_true", help="Store vectors as int8 with per-row scales")
+    import_parser = sub.add_parser("import")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--replace", action="store_true", help="Reset the collection before importing")
+    sub.add_parser("compact")
+    parser.add_argument("--workspace", default=COLLECTION_NAME, help="Workspace (collection) to operate on")
+    args = parser.parse_args()
+
+    from src.vector_store import VectorStoreManager
+    manager = VectorStoreManager(args.workspace)
+    if args.command == "export":
+        export_snapshot(manager, args.path, quantize=args.quantize)
+    elif args.command == "import":
+        import_snapshot(manager, args.path, replace=args.replace)
+    else:
+        compact(manager)
+
+
+if __name__ == "__main__":
+    main()
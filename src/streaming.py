@@ -0,0 +1,150 @@
+import io
+import queue
+import threading
+import time
+from src.llm import extract_chunk_text
+from src.config import STREAM_FLUSH_INTERVAL_SECONDS
+
+_DONE = object()
+
+
+class CancelToken:
+    """
+    Cancellation channel shared by the code that opens an LLM stream and the
+    code that consumes it. Streams registered on the token are closed by
+    cancel() directly, so a request still waiting for its first token is
+    aborted at once instead of after the next chunk arrives.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._streams = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def register(self, stream) -> bool:
+        """Tracks an open stream; closes it right away (and returns False) if already cancelled."""
+        with self._lock:
+            if not self._event.is_set():
+                self._streams.append(stream)
+                return True
+        _close_stream(stream)
+        return False
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            streams, self._streams = self._streams, []
+        for stream in streams:
+            _close_stream(stream)
+
+
+def _close_stream(stream):
+    close = getattr(stream, "close", None)
+    if close:
+        try:
+            close()
+        except Exception as e:
+            # e.g. a generator that is executing on the worker thread; it stops at its next chunk
+            print(f"[Stream] Error closing stream: {e}")
+
+
+class StreamWorker:
+    """
+    Consumes an LLM stream on a background thread.
+    Text pieces are handed to the UI through a queue, and cancel() is a real
+    cancellation channel: it closes the upstream HTTP response (registered on
+    the CancelToken by whoever opened it) so the provider stops generating,
+    and the worker stops reading.
+    """
+
+    def __init__(self, stream, cancel_token: CancelToken = None):
+        self._stream = stream
+        self._queue = queue.Queue()
+        self._cancel = cancel_token or CancelToken()
+        self._buffer = io.StringIO()
+        self._lock = threading.Lock()
+        self.token_count = 0
+        self.error = None
+        self.started = time.perf_counter()
+        self.finished = None
+        self._thread = threading.Thread(target=self._run, name="llm-stream", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            if self._cancel.cancelled:
+                return
+            for chunk in self._stream:
+                if self._cancel.cancelled:
+                    break
+                text = extract_chunk_text(chunk)
+                if text:
+                    with self._lock:
+                        self._buffer.write(text)
+                        self.token_count += 1
+                    self._queue.put(text)
+        except Exception as e:
+            # Reading fails when cancel() closes the response underneath us; that is not an error
+            if not self._cancel.cancelled:
+                self.error = e
+        finally:
+            _close_stream(self._stream)
+            self.finished = time.perf_counter()
+            self._queue.put(_DONE)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.cancelled
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    def cancel(self):
+        """Stops generation; safe to call more than once or after completion."""
+        self._cancel.cancel()
+
+    def text(self) -> str:
+        """Everything received so far."""
+        with self._lock:
+            return self._buffer.getvalue()
+
+    def render(self, placeholder, flush_interval: float = STREAM_FLUSH_INTERVAL_SECONDS, cursor: str = "▌") -> str:
+        """
+        Renders the stream into a Streamlit placeholder, coalescing tokens into
+        one redraw per flush_interval instead of one per token.
+        Returns the full response.
+        """
+        last_flush = 0.0
+        dirty = False
+        while True:
+            try:
+                item = self._queue.get(timeout=flush_interval)
+            except queue.Empty:
+                item = None
+            # Drain whatever else has already arrived
+            finished = item is _DONE
+            dirty = dirty or (item is not None and not finished)
+            while not finished:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                finished = item is _DONE
+                dirty = dirty or not finished
+
+            now = time.perf_counter()
+            if finished:
+                break
+            if dirty and now - last_flush >= flush_interval:
+                placeholder.markdown(self.text() + cursor)
+                last_flush = now
+                dirty = False
+
+        full_response = self.text()
+        placeholder.markdown(full_response)
+        return full_response
@@ -4,16 +4,28 @@ from sentence_transformers import SentenceTransformer
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
+import gc
 import os
+import random
 import shutil
-from typing import List, Dict, Any
-from src.config import CHROMA_DB_DIR, COLLECTION_NAME, EMBEDDING_MODEL_NAME, CHUNK_SIZE, CHUNK_OVERLAP
+import threading
+import time
+import uuid
+import weakref
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from src.config import (
+    CHROMA_DB_DIR, COLLECTION_NAME, EMBEDDING_MODEL_NAME, EMBEDDING_MODELS, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_STORE_DIR, TENANT_MAX_CHUNKS,
+    REINDEX_SHADOW_READ_RATE, INGEST_CHUNK_BATCH
+)
+from src.chunk_store import open_chunk_store, close_chunk_store, discard_chunk_store
+from src.embedding_spaces import ReindexJob, read_spaces, write_spaces, space_collection_name
 
 class CustomEmbeddings:
     """Custom embedding wrapper for SentenceTransformer"""
     def __init__(self, model_name: str):
-        # Explicitly force CPU and avoid accelerate's device_map if possible
-        self.model = SentenceTransformer(model_name, device='cpu', trust_remote_code=True)
+        # Explicitly force CPU and avoid accelerate's device_map if possible.
+        # Never run code shipped with a model repository
+        self.model = SentenceTransformer(model_name, device='cpu', trust_remote_code=False)
     
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         return self.model.encode(texts, convert_to_numpy=True).tolist()
@@ -21,28 +33,352 @@ class CustomEmbeddings:
     def embed_query(self, text: str) -> List[float]:
         return self.model.encode([text], convert_to_numpy=True)[0].tolist()
 
+# Models stay loaded while a manager uses them; one replaced by a re-index is freed
+# once no workspace needs it. The default model is kept loaded regardless.
+_embeddings: "weakref.WeakValueDictionary[str, CustomEmbeddings]" = weakref.WeakValueDictionary()
+_default_embeddings = None
+_embeddings_lock = threading.Lock()
+
+def get_embeddings(model_name: str) -> CustomEmbeddings:
+    """Returns the process-wide embedding model, so opening more collections doesn't load it again."""
+    global _default_embeddings
+    with _embeddings_lock:
+        embeddings = _embeddings.get(model_name)
+        if embeddings is None:
+            embeddings = CustomEmbeddings(model_name)
+            _embeddings[model_name] = embeddings
+        if model_name == EMBEDDING_MODEL_NAME:
+            _default_embeddings = embeddings
+        return embeddings
+
+def _ocr_metadata(ocr_pages: List[Dict], start: int, end: int) -> Dict[str, Any]:
+    """Summarizes the OCR stats of the pages overlapping the chunk span [start, end)."""
+    pages = [p for p in ocr_pages if p["start"] < end and p["end"] > start]
+    if not pages:
+        return {}
+    return {
+        "ocr_pages": ",".join(str(p["page"]) for p in pages),
+        "ocr_seconds": round(sum(p["ocr_seconds"] for p in pages), 3),
+        "ocr_confidence": min(p["ocr_confidence"] for p in pages),
+        "ocr_dpi": max(p["ocr_dpi"] for p in pages),
+        "ocr_cached": all(p["ocr_cached"] for p in pages),
+    }
+
+def _chunk_starts(text: str, chunks: List[str]) -> List[int]:
+    """Character offset of each (overlapping) chunk in the text it was split from."""
+    starts = []
+    cursor = 0
+    for chunk in chunks:
+        start = text.find(chunk, cursor)
+        if start < 0:
+            start = cursor
+        cursor = start + 1
+        starts.append(start)
+    return starts
+
 class VectorStoreManager:
-    def __init__(self):
-        self.embedding_function = CustomEmbeddings(EMBEDDING_MODEL_NAME)
-        self.persist_directory = CHROMA_DB_DIR
-        
-        # Initialize Chroma
-        self.vector_db = Chroma(
-            persist_directory=self.persist_directory,
-            embedding_function=self.embedding_function,
-            collection_name=COLLECTION_NAME
-        )
+    def __init__(self, collection_name: str = COLLECTION_NAME, max_chunks: int = TENANT_MAX_CHUNKS,
+                 embedding_model: str = EMBEDDING_MODEL_NAME, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                 persist_directory: str = None):
+        """
+        collection_name: Workspace/tenant name; also the Chroma collection until the embedding model is switched
+        max_chunks: Quota on chunks stored in this collection (0 disables it)
+        embedding_model, chunk_size, chunk_overlap: Override the defaults from config (used by the evaluation harness).
+        Once a workspace has been re-indexed, its spaces.json decides the embedding model instead.
+        persist_directory: Chroma directory other than CHROMA_DB_DIR (the evaluation harness keeps its
+        indexes apart); the chunk store then lives in its chunk_store subdirectory.
+        """
+        self.collection_name = collection_name
+        self.max_chunks = max_chunks
+        self.persist_directory = persist_directory or CHROMA_DB_DIR
+        chunk_store_dir = os.path.join(persist_directory, "chunk_store") if persist_directory else CHUNK_STORE_DIR
+        self.chunk_store = open_chunk_store(os.path.join(chunk_store_dir, self.collection_name))
+
+        # Writes (and the re-index job's batches) are serialized; _space_lock guards swapping the active space
+        self._write_lock = threading.RLock()
+        self._space_lock = threading.Lock()
+        self._source_versions: Dict[str, int] = {}
+        self._resets = 0
+        self.reindex_job = None
+        self.compacting = False
+        self.deleted = False
+        self.pending_model_name = None
+        self.pending_embedding_function = None
+        self.pending_db = None
+
+        # Initialize Chroma with the active embedding space
+        self.spaces = read_spaces(self.chunk_store.directory, embedding_model, collection_name)
+        active = self.spaces["active"]
+        if active["model"] != embedding_model:
+            print(f"[VectorStore] Workspace {collection_name} is indexed with {active['model']}")
+        self.embedding_model_name = active["model"]
+        self.embedding_function = get_embeddings(active["model"])
+        self.vector_db = self._open_space(active["collection"], self.embedding_function)
+        self._drop_retired()
         
+        self.chunk_size = chunk_size
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
             length_function=len,
             is_separator_regex=False,
         )
 
-    def add_document(self, filename: str, text: str) -> int:
+        self._sync_chunk_store()
+
+        # Resume an interrupted re-index
+        if self.spaces["pending"]:
+            pending = self.spaces["pending"]
+            print(f"[VectorStore] Resuming re-index of {collection_name} with {pending['model']}")
+            self._open_pending(pending["model"], pending["collection"])
+            self.reindex_job = ReindexJob(self)
+
+    def _open_space(self, collection: str, embedding_function: CustomEmbeddings) -> Chroma:
+        return Chroma(
+            persist_directory=self.persist_directory,
+            embedding_function=embedding_function,
+            collection_name=collection
+        )
+
+    def _open_pending(self, model_name: str, collection: str, embedding_function: CustomEmbeddings = None):
+        self.pending_embedding_function = embedding_function or get_embeddings(model_name)
+        self.pending_db = self._open_space(collection, self.pending_embedding_function)
+        self.pending_model_name = model_name
+
+    def _drop_retired(self):
+        """Deletes collections of spaces replaced by a cutover (left behind if the process died mid-way)."""
+        if not self.spaces["retired"]:
+            return
+        client = chromadb.PersistentClient(path=self.persist_directory)
+        for collection in list(self.spaces["retired"]):
+            try:
+                client.delete_collection(collection)
+            except Exception as e:
+                print(f"[VectorStore] Could not drop retired collection {collection}: {e}")
+            self.spaces["retired"].remove(collection)
+        write_spaces(self.chunk_store.directory, self.spaces)
+
+    def _source_version(self, source: str) -> tuple:
+        """Changes whenever the source is re-added or deleted (or the workspace reset)."""
+        return self._resets, self._source_versions.get(source, 0)
+
+    def _bump_sources(self, sources: List[str]):
+        for source in sources:
+            self._source_versions[source] = self._source_versions.get(source, 0) + 1
+
+    @property
+    def reindexing(self) -> bool:
+        return self.reindex_job is not None and self.reindex_job.running
+
+    def start_reindex(self, model_name: str) -> ReindexJob:
+        """
+        Starts building an index of this workspace with another embedding model,
+        from the texts already in the chunk store (no re-extraction or OCR).
+        Queries keep using the current model until the new index has caught up.
+        Only models listed in EMBEDDING_MODELS are accepted.
+        """
+        model_name = model_name.strip()
+        if model_name not in EMBEDDING_MODELS:
+            raise ValueError(f"'{model_name}' is not an allowed embedding model (see EMBEDDING_MODELS).")
+        if model_name == self.embedding_model_name:
+            raise ValueError(f"Workspace '{self.collection_name}' already uses '{model_name}'.")
+        # Loading can take minutes (download included), so it happens before writes are blocked
+        embedding_function = get_embeddings(model_name)
+        with self._write_lock:
+            self._ensure_writable()
+            if self.compacting:
+                raise ValueError("The workspace is being compacted; try again when it finishes.")
+            if self.reindexing:
+                raise ValueError(f"Already re-indexing with '{self.pending_model_name}'. Cancel it first.")
+            if model_name == self.embedding_model_name:
+                raise ValueError(f"Workspace '{self.collection_name}' already uses '{model_name}'.")
+            if self.pending_db is not None and self.pending_model_name != model_name:
+                self._discard_pending()
+
+            collection = space_collection_name(self.collection_name, model_name)
+            print(f"[VectorStore] Re-indexing {self.collection_name} with {model_name} into {collection}")
+            self._open_pending(model_name, collection, embedding_function)
+            self.spaces["pending"] = {"model": model_name, "collection": collection, "started": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            write_spaces(self.chunk_store.directory, self.spaces)
+            self.reindex_job = ReindexJob(self)
+            return self.reindex_job
+
+    def cancel_reindex(self):
+        """Stops a running re-index and deletes the partially built index."""
+        if self.reindex_job is not None:
+            self.reindex_job.cancel()
+        with self._write_lock:
+            self._discard_pending()
+            self.reindex_job = None
+
+    def _discard_pending(self):
+        if self.pending_db is not None:
+            try:
+                self.pending_db.delete_collection()
+            except Exception as e:
+                print(f"[VectorStore] Error deleting pending index: {e}")
+        self.pending_db = None
+        self.pending_embedding_function = None
+        self.pending_model_name = None
+        self.spaces["pending"] = None
+        write_spaces(self.chunk_store.directory, self.spaces)
+
+    def _cut_over(self) -> bool:
+        """Makes the pending space active if it holds every chunk. Called by the re-index job."""
+        with self._write_lock:
+            if self.pending_db is None:
+                return False
+            active_count = self.vector_db._collection.count()
+            pending_count = self.pending_db._collection.count()
+            if active_count != pending_count:
+                print(f"[VectorStore] Not cutting over: {pending_count} of {active_count} chunks re-indexed")
+                return False
+
+            old_model = self.embedding_model_name
+            self.spaces["pending"] = None
+            self._activate_space(self.pending_model_name, self.pending_embedding_function, self.pending_db)
+            self.pending_db = None
+            self.pending_embedding_function = None
+            self.pending_model_name = None
+            print(f"[VectorStore] {self.collection_name} now uses {self.embedding_model_name}")
+        # This manager no longer references the old model; it is freed unless another workspace uses it
+        gc.collect()
+        if old_model not in _embeddings:
+            print(f"[VectorStore] Released embedding model {old_model}")
+        return True
+
+    def _activate_space(self, model_name: str, embedding_function: CustomEmbeddings, vector_db: Chroma):
+        """
+        Makes vector_db the active space: the manifest is replaced first (atomically),
+        then queries are switched over and the old collection is dropped.
+        Callers hold _write_lock.
+        """
+        old_collection = self.spaces["active"]["collection"]
+        self.spaces["active"] = {"model": model_name, "collection": vector_db._collection.name}
+        self.spaces["retired"].append(old_collection)
+        write_spaces(self.chunk_store.directory, self.spaces)
+
+        with self._space_lock:
+            self.vector_db = vector_db
+            self.embedding_function = embedding_function
+            self.embedding_model_name = model_name
+        self._drop_retired()
+
+    @staticmethod
+    def _copy_rows(source, target, ids: List[str] = None, batch_size: int = 1000) -> int:
+        """Copies rows (with their stored vectors) between Chroma collections, by page or by id."""
+        copied = 0
+        if ids is None:
+            offset = 0
+            while True:
+                batch = source.get(limit=batch_size, offset=offset, include=["documents", "metadatas", "embeddings"])
+                if not batch["ids"]:
+                    break
+                target.upsert(ids=batch["ids"], embeddings=batch["embeddings"], documents=batch["documents"], metadatas=batch["metadatas"])
+                copied += len(batch["ids"])
+                offset += batch_size
+            return copied
+        for start in range(0, len(ids), batch_size):
+            batch = source.get(ids=ids[start:start + batch_size], include=["documents", "metadatas", "embeddings"])
+            if batch["ids"]:
+                target.upsert(ids=batch["ids"], embeddings=batch["embeddings"], documents=batch["documents"], metadatas=batch["metadatas"])
+                copied += len(batch["ids"])
+        return copied
+
+    def compact_index(self, batch_size: int = 1000) -> int:
+        """
+        Rebuilds the active collection into a fresh one without the space left by
+        deletes and re-uploads, then switches to it. Queries and writes keep using
+        the old collection during the copy; writes are only blocked for the final
+        catch-up (rows added or deleted meanwhile) and the switch.
+        The chunk store is compacted at the same time. Returns the rows kept.
+        """
+        with self._write_lock:
+            self._ensure_writable()
+            if self.reindexing or self.pending_db is not None:
+                raise ValueError("The embedding model is being switched; wait for the re-index to finish or cancel it.")
+            if self.compacting:
+                raise ValueError("The workspace is already being compacted.")
+            self.compacting = True
+        try:
+            collection = space_collection_name(self.collection_name, self.embedding_model_name, salt=time.strftime("%Y%m%d-%H%M%S"))
+            target_db = self._open_space(collection, self.embedding_function)
+            source = self.vector_db._collection
+            target = target_db._collection
+            print(f"[VectorStore] Compacting {self.collection_name} into {collection}")
+            try:
+                self._copy_rows(source, target, batch_size=batch_size)
+                with self._write_lock:
+                    source_ids = set(source.get(include=[])["ids"])
+                    target_ids = set(target.get(include=[])["ids"])
+                    missing = sorted(source_ids - target_ids)
+                    extra = sorted(target_ids - source_ids)
+                    if missing:
+                        self._copy_rows(source, target, ids=missing, batch_size=batch_size)
+                    if extra:
+                        target.delete(ids=extra)
+                    print(f"[VectorStore] Compaction catch-up: {len(missing)} added, {len(extra)} removed")
+                    self._activate_space(self.embedding_model_name, self.embedding_function, target_db)
+                    self.chunk_store.compact()
+                    return target.count()
+            except Exception:
+                # The half-built copy is not referenced by the manifest; drop it
+                try:
+                    target_db.delete_collection()
+                except Exception as e:
+                    print(f"[VectorStore] Could not drop compaction copy {collection}: {e}")
+                raise
+        finally:
+            self.compacting = False
+
+    def close(self):
+        """Releases the in-memory caches of this collection (the data stays on disk)."""
+        if self.reindex_job is not None:
+            # Stopped, not cancelled: the job resumes the next time the workspace is opened
+            self.reindex_job.cancel()
+        close_chunk_store(self.chunk_store.directory)
+
+    def delete_workspace(self):
+        """
+        Deletes every Chroma collection of this workspace (active and pending) and
+        its chunks. The manager is unusable afterwards: later writes raise ValueError.
+        """
+        self.cancel_reindex()
+        with self._write_lock:
+            self.deleted = True
+            self.vector_db.delete_collection()
+            self.chunk_store.clear()
+        # The directory is about to be removed; a re-created workspace must get a new store
+        discard_chunk_store(self.chunk_store.directory)
+
+    def _ensure_writable(self):
+        """Callers hold _write_lock."""
+        if self.deleted:
+            raise ValueError(f"Workspace '{self.collection_name}' was deleted.")
+
+    def _sync_chunk_store(self, page_size: int = 1000):
+        """Rebuilds the chunk store from Chroma if it is missing or out of date."""
+        collection = self.vector_db._collection
+        total = collection.count()
+        if total == len(self.chunk_store):
+            return
+
+        print(f"[VectorStore] Rebuilding chunk store from {total} stored chunks")
+        rows = []
+        for offset in range(0, total, page_size):
+            batch = collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            for text, meta in zip(batch["documents"], batch["metadatas"]):
+                rows.append((meta.get("source", "unknown"), int(meta.get("chunk_id", 0)), text))
+
+        rows.sort(key=lambda row: (row[0], row[1]))
+        self.chunk_store.clear()
+        self.chunk_store.add_many(rows)
+
+    def add_document(self, filename: str, text: str, ocr_pages: List[Dict] = None) -> int:
         """
         Chunks and adds a document to the vector store.
+        ocr_pages: Optional per-page OCR stats from ingest; chunks overlapping
+        OCR'd pages get their page numbers, timing and confidence as metadata.
         Returns the number of chunks added.
         """
         print(f"\n[VectorStore] add_document called for: {filename}")
@@ -52,93 +388,225 @@ class VectorStoreManager:
             print(f"[VectorStore] No text provided, returning 0")
             return 0
             
-        # Check if document already exists and delete it to prevent duplicates
-        print(f"[VectorStore] Checking for existing chunks of {filename}...")
-        self.delete_documents([filename])
-            
         # Create chunks
         chunks = self.text_splitter.split_text(text)
         print(f"[VectorStore] Created {len(chunks)} chunks")
-        
+
+        with self._write_lock:
+            return self._add_chunks(filename, text, chunks, ocr_pages)
+
+    def _add_chunks(self, filename: str, text: str, chunks: List[str], ocr_pages: List[Dict] = None) -> int:
+        # Enforce the workspace quota before touching the existing version of the document
+        stored = len(self.chunk_store) - self.chunk_store.count_source(filename)
+        if self.max_chunks and stored + len(chunks) > self.max_chunks:
+            raise ValueError(
+                f"Workspace '{self.collection_name}' would exceed its quota of {self.max_chunks} chunks "
+                f"({stored} stored, {len(chunks)} new). Delete documents to make room."
+            )
+
+        # Check if document already exists and delete it to prevent duplicates
+        print(f"[VectorStore] Checking for existing chunks of {filename}...")
+        self.delete_documents([filename])
+
+        self._write_chunks(filename, chunks, _chunk_starts(text, chunks) if ocr_pages else None, ocr_pages)
+        print(f"[VectorStore] Successfully added documents for {filename}")
+        # Chroma 0.4+ persists automatically, but explicit persist calls are deprecated in newer versions.
+        # If using older langchain/chroma versions, might need self.vector_db.persist()
+        return len(chunks)
+
+    def add_document_stream(self, filename: str, pages: Iterable[Tuple[int, str, Optional[Dict]]],
+                            batch_chunks: int = INGEST_CHUNK_BATCH, on_batch: Callable[[int], None] = None) -> Tuple[int, Optional[str]]:
+        """
+        Chunks, embeds and adds a document page by page, batch_chunks chunks at a
+        time, so neither its whole text nor all of its embeddings are held at once.
+        pages: Yields (page_number, text, ocr_stats); ocr_stats is None for pages that were not OCR'd.
+        on_batch: Called with the running chunk count after each batch is stored.
+        Stops early once the workspace quota is reached; raises ValueError (changing
+        nothing) if the quota leaves no room at all.
+        Returns (chunks added, reason the document was cut short or None).
+        """
+        print(f"\n[VectorStore] add_document_stream called for: {filename}")
+        try:
+            return self._stream_document(filename, pages, batch_chunks, on_batch)
+        finally:
+            # Batches skip saving the chunk-store index; persist it once per document
+            self.chunk_store.flush()
+
+    def _stream_document(self, filename: str, pages: Iterable[Tuple[int, str, Optional[Dict]]], batch_chunks: int,
+                         on_batch: Optional[Callable[[int], None]]) -> Tuple[int, Optional[str]]:
+        batch_chars = max(1, batch_chunks) * self.chunk_size
+        buffer = ""
+        buffer_start = 0  # Offset of buffer[0] in the full document text
+        length = 0
+        ocr_pages = []
+        added = 0
+
+        for page_number, page_text, stats in pages:
+            start = length
+            if page_text:
+                buffer += page_text + "\n"
+                length += len(page_text) + 1
+            if stats is not None:
+                ocr_pages.append(dict(stats, page=page_number, start=start, end=length))
+            if len(buffer) < batch_chars:
+                continue
+
+            chunks = self.text_splitter.split_text(buffer)
+            starts = _chunk_starts(buffer, chunks)
+            # The last chunk may continue on the next page, so it stays in the buffer
+            ready = len(chunks) - 1
+            if ready < 1:
+                continue
+            added, reason = self._add_batch(filename, chunks[:ready], [buffer_start + s for s in starts[:ready]], ocr_pages, added)
+            if on_batch:
+                on_batch(added)
+            if reason:
+                return added, reason
+            buffer = buffer[starts[ready]:]
+            buffer_start += starts[ready]
+            ocr_pages = [p for p in ocr_pages if p["end"] > buffer_start]
+
+        if buffer.strip():
+            chunks = self.text_splitter.split_text(buffer)
+            starts = [buffer_start + s for s in _chunk_starts(buffer, chunks)]
+            added, reason = self._add_batch(filename, chunks, starts, ocr_pages, added)
+            if on_batch:
+                on_batch(added)
+            if reason:
+                return added, reason
+        print(f"[VectorStore] Successfully streamed {added} chunks for {filename}")
+        return added, None
+
+    def _add_batch(self, filename: str, chunks: List[str], starts: List[int], ocr_pages: List[Dict], added: int) -> Tuple[int, Optional[str]]:
+        """Stores one batch of a streamed document, trimmed to the workspace quota."""
+        with self._write_lock:
+            if added == 0:
+                # Replacing an earlier version frees its chunks; a partial first batch is trimmed below
+                stored = len(self.chunk_store) - self.chunk_store.count_source(filename)
+                if self.max_chunks and stored >= self.max_chunks:
+                    raise ValueError(
+                        f"Workspace '{self.collection_name}' has reached its quota of {self.max_chunks} chunks "
+                        f"({stored} stored). Delete documents to make room."
+                    )
+                self._delete_chunks([filename])
+
+            reason = None
+            if self.max_chunks and len(self.chunk_store) + len(chunks) > self.max_chunks:
+                room = max(0, self.max_chunks - len(self.chunk_store))
+                chunks, starts = chunks[:room], starts[:room]
+                reason = f"workspace quota of {self.max_chunks} chunks reached"
+            if chunks:
+                print(f"[VectorStore] Adding batch of {len(chunks)} chunks for {filename}")
+                self._write_chunks(filename, chunks, starts, ocr_pages, first_chunk_id=added, save=False)
+            return added + len(chunks), reason
+
+    def _write_chunks(self, filename: str, chunks: List[str], starts: Optional[List[int]], ocr_pages: Optional[List[Dict]],
+                      first_chunk_id: int = 0, save: bool = True):
+        """Embeds chunks into Chroma (both spaces during a re-index) and appends them to the chunk store."""
+        self._ensure_writable()
         # Create Document objects with metadata
         documents = []
         for i, chunk in enumerate(chunks):
+            metadata = {
+                "source": filename,
+                "chunk_id": first_chunk_id + i
+            }
+            if ocr_pages and starts:
+                metadata.update(_ocr_metadata(ocr_pages, starts[i], starts[i] + len(chunk)))
             doc = Document(
                 page_content=chunk,
-                metadata={
-                    "source": filename,
-                    "chunk_id": i
-                }
+                metadata=metadata
             )
             documents.append(doc)
             
         print(f"[VectorStore] Adding {len(documents)} documents to Chroma")
-        self.vector_db.add_documents(documents)
-        print(f"[VectorStore] Successfully added documents for {filename}")
-        # Chroma 0.4+ persists automatically, but explicit persist calls are deprecated in newer versions.
-        # If using older langchain/chroma versions, might need self.vector_db.persist()
-        return len(chunks)
+        ids = [str(uuid.uuid4()) for _ in documents]
+        self.vector_db.add_documents(documents, ids=ids)
+        if self.pending_db is not None:
+            # Dual write while a re-index is in progress, so the new index needs no catching up
+            self.pending_db.add_documents(documents, ids=ids)
+        self.chunk_store.add(filename, chunks, start_chunk_id=first_chunk_id, save=save)
+        self._bump_sources([filename])
 
-    def query_similarity(self, query: str, k: int = 5) -> List[Document]:
-        """Queries the vector store for similar documents."""
-        print(f"\n[VectorStore] query_similarity called")
-        print(f"[VectorStore] Query: {query}")
-        print(f"[VectorStore] k: {k}")
-        
-        results = self.vector_db.similarity_search(query, k=k)
-        
-        print(f"[VectorStore] Found {len(results)} results")
-        
-        # Deduplicate results based on page_content
-        unique_results = []
-        seen_content = set()
-        
-        for doc in results:
-            content_hash = hash(doc.page_content)
-            if content_hash not in seen_content:
-                seen_content.add(content_hash)
-                unique_results.append(doc)
-                
-        print(f"[VectorStore] Unique results: {len(unique_results)}")
-        for i, doc in enumerate(unique_results):
-            print(f"[VectorStore] Result {i+1}: source={doc.metadata.get('source', 'unknown')}, chunk_id={doc.metadata.get('chunk_id', 'N/A')}")
-        
-        return unique_results
-    
-    def query_similarity_filtered(self, query: str, source_filter: List[str] = None, k: int = 5) -> List[Document]:
-        """Queries the vector store, optionally filtering by source filenames."""
-        print(f"\n[VectorStore] query_similarity_filtered called")
-        print(f"[VectorStore] Query: {query}")
-        print(f"[VectorStore] Source filter: {source_filter}")
-        print(f"[VectorStore] k: {k}")
-        
-        if source_filter:
-            # Query with metadata filter
-            results = self.vector_db.similarity_search(
-                query, 
-                k=k,
-                filter={"source": {"$in": source_filter}}
-            )
-        else:
-            results = self.vector_db.similarity_search(query, k=k)
-        
-        print(f"[VectorStore] Found {len(results)} results")
-        
-        # Deduplicate results based on page_content
-        unique_results = []
-        seen_content = set()
-        
-        for doc in results:
-            content_hash = hash(doc.page_content)
-            if content_hash not in seen_content:
-                seen_content.add(content_hash)
-                unique_results.append(doc)
-                
-        print(f"[VectorStore] Unique results: {len(unique_results)}")
-        for i, doc in enumerate(unique_results):
-            print(f"[VectorStore] Result {i+1}: source={doc.metadata.get('source', 'unknown')}, chunk_id={doc.metadata.get('chunk_id', 'N/A')}")
-        
-        return unique_results
+    def import_vectors(self, model_name: str, sources: List[str], count: int,
+                       batches: Iterable[Tuple[List[str], List[str], List[Dict], List[List[float]]]], replace: bool = False) -> int:
+        """
+        Adds pre-computed rows (ids, texts, metadatas, vectors) embedded with model_name,
+        e.g. from a snapshot, without re-embedding them.
+        sources / count: What the rows contain; checked against the quota before anything changes.
+        replace: Reset the workspace first; otherwise only the given sources are replaced.
+        Each batch is written under _write_lock to the space active at that moment, and
+        re-embedded into the pending space during a re-index. Returns the rows imported.
+        """
+        with self._write_lock:
+            self._ensure_writable()
+            if self.compacting:
+                raise ValueError("The workspace is being compacted; try again when it finishes.")
+            if model_name != self.embedding_model_name:
+                raise ValueError(f"Rows were embedded with '{model_name}', but this knowledge base uses '{self.embedding_model_name}'.")
+            total = count if replace else len(self.chunk_store) - sum(self.chunk_store.count_source(s) for s in sources) + count
+            if self.max_chunks and total > self.max_chunks:
+                raise ValueError(
+                    f"Importing would bring workspace '{self.collection_name}' to {total} chunks, "
+                    f"over its quota of {self.max_chunks}."
+                )
+            if replace:
+                self.reset_db()
+            elif sources:
+                self._delete_chunks(sources)
+
+        imported = 0
+        try:
+            for ids, texts, metadatas, vectors in batches:
+                with self._write_lock:
+                    self._ensure_writable()
+                    # A re-index may have cut over since the import started; the vectors would not match
+                    if model_name != self.embedding_model_name:
+                        raise ValueError(f"The embedding model was switched during the import; {imported} rows were imported.")
+                    self.vector_db._collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+                    if self.pending_db is not None:
+                        self.pending_db._collection.upsert(
+                            ids=ids, embeddings=self.pending_embedding_function.embed_documents(texts),
+                            documents=texts, metadatas=metadatas
+                        )
+                    rows = sorted(
+                        ((m.get("source", "unknown"), int(m.get("chunk_id", 0)), t) for t, m in zip(texts, metadatas)),
+                        key=lambda row: (row[0], row[1])
+                    )
+                    self.chunk_store.add_many(rows, save=False)
+                    self._bump_sources({row[0] for row in rows})
+                    imported += len(ids)
+        finally:
+            self.chunk_store.flush()
+        return imported
+
+    def query_ids(self, query: str, k: int = 5, source_filter: List[str] = None) -> List[int]:
+        """
+        Queries the vector store and returns deduplicated chunk-store IDs.
+        Only metadata is fetched from Chroma; texts are read from the chunk store on demand.
+        """
+        with self._space_lock:
+            embedding_function, vector_db = self.embedding_function, self.vector_db
+        embedding = embedding_function.embed_query(query)
+        where = {"source": {"$in": source_filter}} if source_filter else None
+        result = vector_db._collection.query(
+            query_embeddings=[embedding],
+            n_results=k,
+            where=where,
+            include=["metadatas"]
+        )
+
+        metadatas = result["metadatas"][0] if result["metadatas"] else []
+        job = self.reindex_job
+        if job is not None and job.running and random.random() < REINDEX_SHADOW_READ_RATE:
+            job.shadow_read(query, k, source_filter, [(m.get("source"), m.get("chunk_id")) for m in metadatas])
+
+        ids = []
+        for meta in metadatas:
+            chunk = self.chunk_store.lookup(meta.get("source", "unknown"), meta.get("chunk_id", 0))
+            if chunk is not None:
+                ids.append(chunk)
+        return self.chunk_store.dedupe(ids)
 
     def list_documents(self) -> List[str]:
         """
@@ -146,11 +614,7 @@ class VectorStoreManager:
         Lists all unique document sources in the vector store.
         """
         try:
-            # Get all documents
-            all_docs = self.vector_db.get()
-            if all_docs and 'metadatas' in all_docs:
-                sources = set([meta.get('source', 'unknown') for meta in all_docs['metadatas']])
-                return sorted(list(sources))
+            return self.chunk_store.sources()
         except Exception as e:
             print(f"Error listing documents: {e}")
         return []
@@ -160,36 +624,38 @@ class VectorStoreManager:
         print(f"\n[VectorStore] delete_documents called for: {filenames}")
         
         try:
-            # Get all documents
-            all_docs = self.vector_db.get()
-            
-            if all_docs and 'ids' in all_docs and 'metadatas' in all_docs:
-                # Find IDs of documents to delete
-                ids_to_delete = []
-                for i, meta in enumerate(all_docs['metadatas']):
-                    if meta.get('source') in filenames:
-                        ids_to_delete.append(all_docs['ids'][i])
-                
-                if ids_to_delete:
-                    print(f"[VectorStore] Deleting {len(ids_to_delete)} chunks")
-                    self.vector_db.delete(ids=ids_to_delete)
-                    print(f"[VectorStore] Successfully deleted documents: {filenames}")
-                else:
-                    print(f"[VectorStore] No chunks found for: {filenames}")
+            with self._write_lock:
+                self._delete_chunks(filenames)
         except Exception as e:
             print(f"[VectorStore] Error deleting documents: {e}")
 
+    def _delete_chunks(self, filenames: List[str]):
+        removed = self.chunk_store.delete_sources(filenames)
+        self._bump_sources(filenames)
+        if removed:
+            print(f"[VectorStore] Deleting {removed} chunks")
+            for vector_db in (self.vector_db, self.pending_db):
+                if vector_db is not None:
+                    vector_db._collection.delete(where={"source": {"$in": filenames}})
+            print(f"[VectorStore] Successfully deleted documents: {filenames}")
+        else:
+            print(f"[VectorStore] No chunks found for: {filenames}")
+
     def reset_db(self):
         """
         Clears the database.
         """
-        # Delete the collection and re-create
+        with self._write_lock:
+            self._ensure_writable()
+        # Delete the collection(s) and re-create
         try:
-            self.vector_db.delete_collection()
-            self.vector_db = Chroma(
-                persist_directory=self.persist_directory,
-                embedding_function=self.embedding_function,
-                collection_name=COLLECTION_NAME
-            )
+            with self._write_lock:
+                self.vector_db.delete_collection()
+                self.vector_db = self._open_space(self.spaces["active"]["collection"], self.embedding_function)
+                if self.pending_db is not None:
+                    self.pending_db.delete_collection()
+                    self.pending_db = self._open_space(self.spaces["pending"]["collection"], self.pending_embedding_function)
+                self.chunk_store.clear()
+                self._resets += 1
         except Exception as e:
             print(f"Error resetting DB: {e}")
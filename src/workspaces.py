@@ -0,0 +1,147 @@
+import os
+import re
+import shutil
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, List
+
+import chromadb
+
+from src.config import (
+    CHROMA_DB_DIR, CHUNK_STORE_DIR, COLLECTION_NAME, TENANT_MAX_CHUNKS, TENANT_MAX_CONCURRENT_LLM_CALLS, MAX_OPEN_WORKSPACES,
+    EVAL_COLLECTION_PREFIX, EMBEDDING_SPACE_PREFIX
+)
+from src.vector_store import VectorStoreManager
+
+# Chroma collection names: 3-63 characters, alphanumerics plus . _ -, starting and ending alphanumeric
+_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{1,61}[A-Za-z0-9]$")
+
+
+def validate_workspace_name(name: str) -> str:
+    name = name.strip()
+    if not _NAME_RE.match(name) or ".." in name:
+        raise ValueError(
+            "Workspace names must be 3-63 characters of letters, digits, '.', '_' or '-', "
+            "starting and ending with a letter or digit."
+        )
+    # Internal collections (embedding spaces, evaluation indexes) must never be opened as workspaces
+    if name.startswith((EMBEDDING_SPACE_PREFIX, EVAL_COLLECTION_PREFIX)):
+        raise ValueError(f"Workspace names must not start with '{EMBEDDING_SPACE_PREFIX}' or '{EVAL_COLLECTION_PREFIX}'.")
+    return name
+
+
+class Workspace:
+    __slots__ = ("name", "vector_store", "llm_slots", "last_used")
+
+    def __init__(self, name: str, vector_store: VectorStoreManager, llm_slots: threading.BoundedSemaphore):
+        self.name = name
+        self.vector_store = vector_store
+        self.llm_slots = llm_slots
+        self.last_used = time.monotonic()
+
+
+class WorkspaceRegistry:
+    """
+    Opens one VectorStoreManager (collection + chunk store) per workspace on demand.
+    At most max_open workspaces are pinned in memory; when another is opened the
+    least recently used one is unpinned. An unpinned manager is only freed once
+    nothing uses it any more (another session, an ingest, a re-index job); until
+    then open() hands out that same instance, so there is never more than one
+    manager per workspace. Each workspace also carries a semaphore that caps its
+    concurrent LLM calls.
+    """
+
+    def __init__(self, max_open: int = MAX_OPEN_WORKSPACES, max_chunks: int = TENANT_MAX_CHUNKS,
+                 max_llm_calls: int = TENANT_MAX_CONCURRENT_LLM_CALLS):
+        self.max_open = max(1, max_open)
+        self.max_chunks = max_chunks
+        self.max_llm_calls = max(1, max_llm_calls)
+        self._lock = threading.RLock()
+        self._open: "OrderedDict[str, Workspace]" = OrderedDict()
+        self._unpinned: "weakref.WeakValueDictionary[str, VectorStoreManager]" = weakref.WeakValueDictionary()
+        # Semaphores outlive close() so in-flight calls of a closed workspace still count
+        self._llm_slots: Dict[str, threading.BoundedSemaphore] = {}
+
+    def list_workspaces(self) -> List[str]:
+        """Returns all workspaces on disk (open or not)."""
+        client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+        names = {c if isinstance(c, str) else c.name for c in client.list_collections()}
+        # A workspace re-indexed with another embedding model lives in a space-* collection,
+        # so its chunk store directory is what still carries the workspace name
+        if os.path.isdir(CHUNK_STORE_DIR):
+            names.update(os.listdir(CHUNK_STORE_DIR))
+        # Evaluation indexes and embedding spaces are internal, not user workspaces
+        names = {name for name in names if not name.startswith((EVAL_COLLECTION_PREFIX, EMBEDDING_SPACE_PREFIX))}
+        names.add(COLLECTION_NAME)
+        return sorted(names)
+
+    def open_workspaces(self) -> List[str]:
+        with self._lock:
+            return list(self._open)
+
+    def open(self, name: str) -> VectorStoreManager:
+        """Returns the workspace's VectorStoreManager, opening it if needed."""
+        name = validate_workspace_name(name)
+        with self._lock:
+            workspace = self._open.get(name)
+            if workspace is None:
+                print(f"[Workspaces] Opening workspace: {name}")
+                if name not in self._llm_slots:
+                    self._llm_slots[name] = threading.BoundedSemaphore(self.max_llm_calls)
+                vector_store = self._unpinned.pop(name, None) or VectorStoreManager(name, max_chunks=self.max_chunks)
+                workspace = Workspace(name, vector_store, self._llm_slots[name])
+                self._open[name] = workspace
+                while len(self._open) > self.max_open:
+                    oldest = next(iter(self._open))
+                    self._close_locked(oldest)
+            self._open.move_to_end(name)
+            workspace.last_used = time.monotonic()
+            return workspace.vector_store
+
+    def close(self, name: str):
+        """Unpins a workspace; it is freed once no session or job uses it. Its data stays on disk."""
+        with self._lock:
+            self._close_locked(name)
+
+    def _close_locked(self, name: str):
+        workspace = self._open.pop(name, None)
+        if workspace is not None:
+            print(f"[Workspaces] Unpinning workspace: {name}")
+            self._unpinned[name] = workspace.vector_store
+
+    def delete(self, name: str):
+        """
+        Deletes a workspace and all of its documents. Managers other sessions still
+        hold are marked deleted (their writes fail); the next open() starts afresh.
+        """
+        name = validate_workspace_name(name)
+        with self._lock:
+            workspace = self._open.pop(name, None)
+            vector_store = self._unpinned.pop(name, None) or (workspace.vector_store if workspace else None)
+            if vector_store is None:
+                vector_store = VectorStoreManager(name, max_chunks=self.max_chunks)
+            print(f"[Workspaces] Deleting workspace: {name}")
+            vector_store.delete_workspace()
+            shutil.rmtree(vector_store.chunk_store.directory, ignore_errors=True)
+
+    def llm_slots(self, name: str) -> threading.BoundedSemaphore:
+        """Semaphore limiting the workspace's concurrent LLM calls; hand it to RAGPipeline."""
+        with self._lock:
+            if name not in self._llm_slots:
+                self._llm_slots[name] = threading.BoundedSemaphore(self.max_llm_calls)
+            return self._llm_slots[name]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> WorkspaceRegistry:
+    """Returns the process-wide workspace registry shared by all sessions."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = WorkspaceRegistry()
+        return _registry
@@ -0,0 +1,16 @@
+"""Test doubles shared by the Chroma-backed tests."""
+import hashlib
+
+
+class FakeEmbeddings:
+    """Deterministic stand-in for the SentenceTransformer model (no download)."""
+
+    def _embed(self, text):
+        digest = hashlib.sha1(text.encode("utf-8")).digest()
+        return [b / 255.0 for b in digest[:8]]
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
@@ -0,0 +1,122 @@
+import shutil
+import threading
+
+from src.chunk_store import ChunkStore, open_chunk_store, close_chunk_store, discard_chunk_store
+
+
+def test_add_and_read_back(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    ids = store.add("a.pdf", ["first", "second", "ünïcode"])
+    assert len(store) == 3
+    assert store.texts(ids) == ["first", "second", "ünïcode"]
+    assert store.lookup("a.pdf", 1) == ids[1]
+    assert store.lookup("a.pdf", 9) is None
+    assert store.lookup("missing.pdf", 0) is None
+    assert store.source(ids[0]) == "a.pdf"
+    assert store.count_source("a.pdf") == 3
+
+
+def test_delete_tombstones_and_counts(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    a = store.add("a.pdf", ["a0", "a1"])
+    b = store.add("b.pdf", ["b0"])
+    assert store.delete_sources(["a.pdf", "unknown.pdf"]) == 2
+    assert len(store) == 1
+    assert not store.is_live(a[0])
+    assert store.is_live(b[0])
+    assert store.count_source("a.pdf") == 0
+    assert store.sources() == ["b.pdf"]
+
+
+def test_index_persists_across_reopen(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    store.add("a.pdf", ["a0", "a1"])
+    store.add("b.pdf", ["b0"], save=False)
+    store.add("b.pdf", ["b1"], start_chunk_id=1, save=False)
+    store.flush()
+    store.delete_sources(["a.pdf"])
+
+    reopened = ChunkStore(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.sources() == ["b.pdf"]
+    assert reopened.count_source("b.pdf") == 2
+    assert reopened.text(reopened.lookup("b.pdf", 1)) == "b1"
+
+
+def test_dedupe_and_expand(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    ids = store.add("a.pdf", ["c0", "c1", "c2", "c3", "c4"])
+    copy = store.add("b.pdf", ["c2"])[0]
+    assert store.dedupe([ids[2], ids[2], copy, ids[0]]) == [ids[2], ids[0]]
+    assert store.expand([ids[2]], 1) == ids[1:4]
+    assert store.expand([ids[0], ids[4]], 1) == [ids[0], ids[1], ids[3], ids[4]]
+    assert store.expand(ids[:2], 0) == ids[:2]
+
+
+def test_compact_reclaims_space_and_bumps_generation(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    store.add("a.pdf", ["x" * 100, "y" * 100])
+    store.add("b.pdf", ["b0", "b1"])
+    store.delete_sources(["a.pdf"])
+    generation = store.generation
+    assert store.compact() == 200
+    assert store.generation > generation
+    assert [store.text(store.lookup("b.pdf", i)) for i in range(2)] == ["b0", "b1"]
+    assert len(ChunkStore(str(tmp_path))) == 2
+
+
+def test_open_chunk_store_shares_one_instance(tmp_path):
+    directory = str(tmp_path / "ws")
+    store = open_chunk_store(directory)
+    store.add("a.pdf", ["a0"])
+    assert open_chunk_store(directory) is store
+    # Closing only unmaps; holders keep working and reopening returns the same store
+    close_chunk_store(directory)
+    assert store.text(store.lookup("a.pdf", 0)) == "a0"
+    assert open_chunk_store(directory) is store
+
+
+def test_concurrent_writers_and_readers(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    errors = []
+
+    def write(n):
+        try:
+            for i in range(20):
+                store.add(f"doc{n}-{i}.pdf", [f"{n}-{i}-{j}" for j in range(5)])
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            for _ in range(200):
+                for source in store.sources():
+                    chunk = store.lookup(source, 0)
+                    if chunk is not None:
+                        store.text(chunk)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)] + [threading.Thread(target=read) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(store) == 400
+    assert len(ChunkStore(str(tmp_path))) == 400
+
+
+def test_discarded_store_is_not_handed_out_again(tmp_path):
+    directory = str(tmp_path / "ws")
+    store = open_chunk_store(directory)
+    store.add("a.pdf", ["a0"])
+    store.clear()
+    discard_chunk_store(directory)
+    shutil.rmtree(directory)
+
+    fresh = open_chunk_store(directory)
+    assert fresh is not store
+    fresh.add("b.pdf", ["b0"])
+    assert fresh.text(fresh.lookup("b.pdf", 0)) == "b0"
@@ -0,0 +1,98 @@
+import pytest
+
+from src.chunk_store import ChunkStore
+from src.conversation import ConversationState, can_reuse_context, estimate_tokens, is_follow_up
+
+
+@pytest.mark.parametrize("query", [
+    "Why do transformers use attention?",
+    "What is BERT and how does it compare to GPT?",
+    "Also, how is dropout applied during training?",
+    "Explain the encoder architecture of the model",
+    "Is that benchmark result reproducible on ImageNet with ResNet?",
+])
+def test_fresh_questions_are_not_follow_ups(query):
+    assert not is_follow_up(query)
+
+
+@pytest.mark.parametrize("query", [
+    "What about its limitations?",
+    "how about the decoder",
+    "Tell me more",
+    "Elaborate on that.",
+    "Why does it work?",
+    "What are those?",
+])
+def test_elliptical_questions_are_follow_ups(query):
+    assert is_follow_up(query)
+
+
+@pytest.fixture
+def turn(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    ids = store.add("paper.pdf", ["Transformers rely on attention.", "Attention has quadratic cost."])
+    conversation = ConversationState()
+    last = conversation.start_turn("How do transformers work?", "How do transformers work?", ids, ["paper.pdf"],
+                                   store_generation=store.generation, source_filter=["paper.pdf"])
+    conversation.record_answer("Transformers use attention over all tokens.")
+    return store, last
+
+
+def test_follow_up_reuses_context(turn):
+    store, last = turn
+    assert can_reuse_context(last, "Tell me more about it", ["paper.pdf"], store)
+
+
+def test_new_topic_terms_force_retrieval(turn):
+    store, last = turn
+    assert not can_reuse_context(last, "What about convolutions?", ["paper.pdf"], store)
+
+
+def test_changed_source_filter_forces_retrieval(turn):
+    store, last = turn
+    assert not can_reuse_context(last, "Tell me more about it", None, store)
+    assert not can_reuse_context(last, "Tell me more about it", ["paper.pdf", "other.pdf"], store)
+
+
+def test_fresh_question_forces_retrieval(turn):
+    store, last = turn
+    assert not can_reuse_context(last, "Why do transformers use attention?", ["paper.pdf"], store)
+
+
+def test_deleted_chunks_force_retrieval(turn):
+    store, last = turn
+    store.delete_sources(["paper.pdf"])
+    assert not can_reuse_context(last, "Tell me more about it", ["paper.pdf"], store)
+
+
+def test_renumbered_store_forces_retrieval(turn):
+    store, last = turn
+    store.add("other.pdf", ["unrelated"])
+    store.compact()
+    assert not can_reuse_context(last, "Tell me more about it", ["paper.pdf"], store)
+
+
+def test_no_previous_turn():
+    assert not can_reuse_context(None, "Tell me more", None, None)
+
+
+def test_history_stays_within_budget():
+    conversation = ConversationState(history_tokens=120, recent_turns=2)
+    for i in range(12):
+        query = f"Question {i} about topic{i} " + "detail " * (i * 3)
+        conversation.start_turn(query, query, [], [])
+        conversation.record_answer(f"Answer {i}. " + "filler words " * (i * 5))
+        history = conversation.history_text()
+        assert estimate_tokens(history) <= 120
+        assert len(conversation.turns) <= 2
+    assert "Earlier in this conversation" in history
+    assert "Question 11" in history
+
+
+def test_oversized_last_turn_is_truncated():
+    conversation = ConversationState(history_tokens=50)
+    conversation.start_turn("q", "q", [], [])
+    conversation.record_answer("x" * 1000)
+    history = conversation.history_text()
+    assert history.startswith("User: q")
+    assert estimate_tokens(history) <= 50
@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+pytest.importorskip("langchain_community")
+pytest.importorskip("sentence_transformers")
+
+import src.embedding_spaces as embedding_spaces
+import src.vector_store as vector_store
+from tests.fakes import FakeEmbeddings
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    """Holds every re-index pass until set, so tests can write while a job is running."""
+    go = threading.Event()
+    index_pass = embedding_spaces.ReindexJob._index_pass
+
+    def gated(job):
+        while not go.wait(0.01):
+            if job._cancel.is_set():
+                return 0
+        job.max_rate = 0
+        return index_pass(job)
+
+    monkeypatch.setattr(embedding_spaces.ReindexJob, "_index_pass", gated)
+    return go
+
+
+@pytest.fixture
+def make_manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "get_embeddings", lambda model_name: FakeEmbeddings())
+    monkeypatch.setattr(vector_store, "EMBEDDING_MODELS", vector_store.EMBEDDING_MODELS + ["new-model"])
+
+    def make(name="reindex-test"):
+        return vector_store.VectorStoreManager(name, max_chunks=0, chunk_size=200, chunk_overlap=40,
+                                               persist_directory=str(tmp_path / "chroma"))
+    return make
+
+
+def _ids(collection, source):
+    return set(collection.get(where={"source": source}, include=[])["ids"])
+
+
+def _collections(manager):
+    client = chromadb.PersistentClient(path=manager.persist_directory)
+    return {c if isinstance(c, str) else c.name for c in client.list_collections()}
+
+
+def _manifest(manager):
+    with open(os.path.join(manager.chunk_store.directory, embedding_spaces.SPACES_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_writes_during_reindex_reach_both_spaces(make_manager, gate):
+    manager = make_manager()
+    manager.add_document("a.pdf", "alpha " * 200)
+    manager.add_document("b.pdf", "bravo " * 200)
+    old_collection = manager.vector_db._collection.name
+    job = manager.start_reindex("new-model")
+
+    manager.add_document("c.pdf", "charlie " * 200)
+    manager.delete_documents(["a.pdf"])
+    pending = manager.pending_db._collection
+    assert _ids(pending, "c.pdf") == _ids(manager.vector_db._collection, "c.pdf")
+    assert not _ids(pending, "b.pdf")
+
+    gate.set()
+    job._thread.join(10)
+    assert job.cut_over and job.error is None
+    assert manager.embedding_model_name == "new-model"
+    assert manager.vector_db._collection.count() == len(manager.chunk_store)
+    assert not _ids(manager.vector_db._collection, "a.pdf")
+    assert _manifest(manager)["active"]["model"] == "new-model"
+    assert _manifest(manager)["pending"] is None
+    assert old_collection not in _collections(manager)
+
+
+def test_resume_embeds_only_missing_chunks(make_manager, gate):
+    manager = make_manager()
+    manager.add_document("a.pdf", "alpha " * 200)
+    manager.add_document("b.pdf", "bravo " * 200)
+    job = manager.start_reindex("new-model")
+    manager.add_document("late.pdf", "late " * 200)  # Dual-written
+    job.cancel()  # Stopped, not discarded: the pending space stays in the manifest
+
+    # A partially built source, as left by a job that stopped mid-way
+    active = manager.vector_db._collection
+    half = sorted(_ids(active, "a.pdf"))[::2]
+    manager._copy_rows(active, manager.pending_db._collection, ids=half)
+    already = len(half) + len(_ids(active, "late.pdf"))
+    del manager, job
+
+    gate.set()
+    resumed = make_manager()
+    assert resumed.reindex_job is not None
+    resumed.reindex_job._thread.join(10)
+    progress = resumed.reindex_job.progress()
+    assert progress["cut_over"], progress
+    assert resumed.reindex_job.embedded == len(resumed.chunk_store) - already
+    assert resumed.embedding_model_name == "new-model"
+    assert resumed.vector_db._collection.count() == len(resumed.chunk_store)
+
+
+def test_cut_over_requires_matching_counts(make_manager, gate):
+    manager = make_manager()
+    manager.add_document("a.pdf", "alpha " * 200)
+    job = manager.start_reindex("new-model")
+    job.cancel()
+
+    assert not manager._cut_over()
+    assert manager.embedding_model_name != "new-model"
+    assert manager.pending_db is not None
+
+    manager._copy_rows(manager.vector_db._collection, manager.pending_db._collection)
+    assert manager._cut_over()
+    assert manager.embedding_model_name == "new-model"
+
+
+def test_cancel_discards_pending_space(make_manager, gate):
+    manager = make_manager()
+    manager.add_document("a.pdf", "alpha " * 200)
+    model = manager.embedding_model_name
+    manager.start_reindex("new-model")
+    pending_collection = manager.pending_db._collection.name
+
+    manager.cancel_reindex()
+    assert manager.pending_db is None and manager.reindex_job is None
+    assert manager.embedding_model_name == model
+    assert _manifest(manager)["pending"] is None
+    assert pending_collection not in _collections(manager)
+
+    # Later writes only go to the active space, and a new re-index can start
+    manager.add_document("b.pdf", "bravo " * 200)
+    gate.set()
+    job = manager.start_reindex("new-model")
+    job._thread.join(10)
+    assert job.cut_over
@@ -0,0 +1,169 @@
+import numpy as np
+import pytest
+
+from src.snapshot import _quantize, export_snapshot, import_snapshot, iter_snapshot, read_manifest
+
+
+class FakeCollection:
+    """The slice of a Chroma collection that export_snapshot reads."""
+
+    def __init__(self, rows):
+        self.rows = rows  # (id, text, metadata, vector)
+
+    def count(self):
+        return len(self.rows)
+
+    def get(self, limit, offset, include):
+        batch = self.rows[offset:offset + limit]
+        return {
+            "ids": [r[0] for r in batch],
+            "documents": [r[1] for r in batch],
+            "metadatas": [r[2] for r in batch],
+            "embeddings": [r[3] for r in batch],
+        }
+
+
+class FakeManager:
+    embedding_model_name = "fake-model"
+
+    def __init__(self, rows):
+        self.vector_db = type("FakeDB", (), {"_collection": FakeCollection(rows)})()
+
+
+def _rows(count, dimension=6):
+    rng = np.random.default_rng(0)
+    rows = []
+    for i in range(count):
+        vector = rng.normal(size=dimension).astype(np.float32).tolist()
+        if i == 1:
+            vector = [0.0] * dimension
+        text = "" if i == 2 else f"chunk {i} — ünïcode"
+        rows.append((f"id-{i}", text, {"source": f"doc{i % 3}.pdf", "chunk_id": i}, vector))
+    return rows
+
+
+def _read_all(path, batch_size):
+    ids, texts, metadatas, vectors = [], [], [], []
+    for batch_ids, batch_texts, batch_metadatas, batch_vectors in iter_snapshot(path, batch_size=batch_size):
+        assert len(batch_ids) <= batch_size
+        ids += batch_ids
+        texts += batch_texts
+        metadatas += batch_metadatas
+        vectors.append(batch_vectors)
+    return ids, texts, metadatas, np.concatenate(vectors) if vectors else np.empty((0, 0))
+
+
+def test_quantize_handles_zero_rows():
+    vectors = np.array([[0.5, -1.0, 0.25], [0.0, 0.0, 0.0]], dtype=np.float32)
+    quantized, scales = _quantize(vectors)
+    assert quantized.dtype == np.int8 and scales.dtype == np.float32
+    assert scales[1] == 1.0 and not quantized[1].any()
+    assert np.abs(quantized[0]).max() == 127
+    np.testing.assert_allclose(quantized * scales[:, None], vectors, atol=scales[0] / 2)
+
+
+@pytest.mark.parametrize("export_batch,read_batch", [(3, 2), (7, 7), (100, 4)])
+def test_float32_round_trip(tmp_path, export_batch, read_batch):
+    rows = _rows(7)
+    manifest = export_snapshot(FakeManager(rows), str(tmp_path), batch_size=export_batch)
+    assert manifest["count"] == 7 and manifest["dimension"] == 6 and manifest["vector_dtype"] == "float32"
+    assert manifest["sources"] == ["doc0.pdf", "doc1.pdf", "doc2.pdf"]
+    assert read_manifest(str(tmp_path)) == manifest
+
+    ids, texts, metadatas, vectors = _read_all(str(tmp_path), read_batch)
+    assert ids == [r[0] for r in rows]
+    assert texts == [r[1] for r in rows]
+    assert metadatas == [r[2] for r in rows]
+    np.testing.assert_array_equal(vectors, np.array([r[3] for r in rows], dtype=np.float32))
+
+
+def test_int8_round_trip(tmp_path):
+    rows = _rows(7)
+    manifest = export_snapshot(FakeManager(rows), str(tmp_path), quantize=True, batch_size=3)
+    assert manifest["vector_dtype"] == "int8"
+
+    ids, texts, _, vectors = _read_all(str(tmp_path), 2)
+    original = np.array([r[3] for r in rows], dtype=np.float32)
+    assert ids == [r[0] for r in rows] and texts == [r[1] for r in rows]
+    assert not vectors[1].any()
+    tolerance = np.abs(original).max(axis=1, keepdims=True) / 127.0 / 2 + 1e-6
+    assert (np.abs(vectors - original) <= tolerance).all()
+
+
+def test_empty_snapshot(tmp_path):
+    manifest = export_snapshot(FakeManager([]), str(tmp_path))
+    assert manifest["count"] == 0 and manifest["sources"] == []
+    assert list(iter_snapshot(str(tmp_path))) == []
+
+
+@pytest.fixture
+def make_manager(tmp_path, monkeypatch):
+    pytest.importorskip("chromadb")
+    pytest.importorskip("langchain_community")
+    pytest.importorskip("sentence_transformers")
+    import src.vector_store as vector_store
+    from tests.fakes import FakeEmbeddings
+
+    monkeypatch.setattr(vector_store, "get_embeddings", lambda model_name: FakeEmbeddings())
+
+    def make(name, max_chunks=0):
+        return vector_store.VectorStoreManager(name, max_chunks=max_chunks, chunk_size=200, chunk_overlap=40,
+                                               persist_directory=str(tmp_path / "chroma"))
+    return make
+
+
+def test_import_replaces_snapshot_sources(tmp_path, make_manager):
+    source = make_manager("source-ws")
+    source.add_document("a.pdf", "alpha " * 200)
+    export_snapshot(source, str(tmp_path / "snap"), batch_size=3)
+
+    target = make_manager("target-ws")
+    target.add_document("a.pdf", "old version " * 50)
+    target.add_document("b.pdf", "bravo " * 100)
+    imported = import_snapshot(target, str(tmp_path / "snap"), batch_size=2)
+
+    assert imported == source.chunk_store.count_source("a.pdf")
+    assert target.chunk_store.sources() == ["a.pdf", "b.pdf"]
+    assert target.chunk_store.count_source("a.pdf") == imported
+    assert target.vector_db._collection.count() == len(target.chunk_store)
+    assert target.query_ids("alpha", k=1)
+
+
+def test_import_over_quota_changes_nothing(tmp_path, make_manager):
+    source = make_manager("source-ws")
+    source.add_document("a.pdf", "alpha " * 200)
+    export_snapshot(source, str(tmp_path / "snap"))
+
+    target = make_manager("target-ws", max_chunks=len(source.chunk_store) + 1)
+    target.add_document("b.pdf", "bravo " * 50)
+    with pytest.raises(ValueError):
+        import_snapshot(target, str(tmp_path / "snap"))
+    assert target.chunk_store.sources() == ["b.pdf"]
+
+
+def test_import_refused_while_compacting(tmp_path, make_manager):
+    source = make_manager("source-ws")
+    source.add_document("a.pdf", "alpha " * 200)
+    export_snapshot(source, str(tmp_path / "snap"))
+
+    target = make_manager("target-ws")
+    target.compacting = True
+    with pytest.raises(ValueError):
+        import_snapshot(target, str(tmp_path / "snap"))
+
+
+def test_import_dual_writes_during_reindex(tmp_path, make_manager, monkeypatch):
+    import src.vector_store as vector_store
+    monkeypatch.setattr(vector_store, "EMBEDDING_MODELS", vector_store.EMBEDDING_MODELS + ["other-model"])
+    source = make_manager("source-ws")
+    source.add_document("a.pdf", "alpha " * 200)
+    export_snapshot(source, str(tmp_path / "snap"))
+
+    target = make_manager("target-ws")
+    target.add_document("b.pdf", "bravo " * 50)
+    job = target.start_reindex("other-model")
+    job.cancel()  # Keep the pending space open without letting the job cut over
+    imported = import_snapshot(target, str(tmp_path / "snap"))
+
+    pending_ids = set(target.pending_db._collection.get(where={"source": "a.pdf"}, include=[])["ids"])
+    assert len(pending_ids) == imported
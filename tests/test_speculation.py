@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("langchain_community")
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("groq")
+
+from src.chunk_store import ChunkStore
+from src.rag import RAGPipeline
+
+
+class FakeVectorStore:
+    """Answers every query with the first chunk of each source and records the queries searched."""
+
+    def __init__(self, directory):
+        self.chunk_store = ChunkStore(directory)
+        self.chunk_store.add("a.pdf", ["alpha"])
+        self.chunk_store.add("b.pdf", ["bravo"])
+        self.queries = []
+        self.searched = threading.Event()
+
+    def query_ids(self, query, k=5, source_filter=None):
+        self.queries.append(query)
+        self.searched.set()
+        return [self.chunk_store.lookup(s, 0) for s in self.chunk_store.sources()][:k]
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    return RAGPipeline(vector_store=FakeVectorStore(str(tmp_path)))
+
+
+def _prefetched(pipeline, query, debounce=0.0):
+    pipeline.prefetch_context(query, debounce=debounce)
+    assert pipeline.vector_store.searched.wait(2)
+    # The result is stored right after the search returns
+    deadline = time.perf_counter() + 2
+    while pipeline._speculation is None or not pipeline._speculation[2].done():
+        assert time.perf_counter() < deadline
+        time.sleep(0.01)
+    pipeline.vector_store.searched.clear()
+
+
+def test_submitted_draft_reuses_prefetch(pipeline):
+    _prefetched(pipeline, "attention")
+    ids = pipeline.retrieve_ids("attention")
+    assert ids and pipeline.vector_store.queries == ["attention"]
+    assert pipeline.metrics.count("speculative_hits") == 1
+
+
+def test_newer_draft_supersedes_pending_one(pipeline):
+    pipeline.prefetch_context("atten", debounce=0.2)
+    pipeline.prefetch_context("attention", debounce=0.05)
+    assert pipeline.vector_store.searched.wait(2)
+    time.sleep(0.3)
+    assert pipeline.vector_store.queries == ["attention"]
+
+
+def test_submit_cancels_pending_timer(pipeline):
+    pipeline.prefetch_context("attention", debounce=0.2)
+    pipeline.retrieve_ids("attention")
+    time.sleep(0.3)
+    assert pipeline.vector_store.queries == ["attention"]
+    assert pipeline._speculation is None
+    assert pipeline.metrics.count("speculative_hits") == 0
+
+
+def test_different_query_searches_again(pipeline):
+    _prefetched(pipeline, "attention")
+    pipeline.retrieve_ids("convolution")
+    assert pipeline.vector_store.queries == ["attention", "convolution"]
+
+
+def test_deleted_chunks_force_new_search(pipeline):
+    _prefetched(pipeline, "attention")
+    pipeline.vector_store.chunk_store.delete_sources(["a.pdf"])
+    ids = pipeline.retrieve_ids("attention")
+    assert pipeline.vector_store.queries == ["attention", "attention"]
+    assert all(pipeline.vector_store.chunk_store.is_live(i) for i in ids)
+
+
+def test_renumbered_store_forces_new_search(pipeline):
+    _prefetched(pipeline, "attention")
+    pipeline.vector_store.chunk_store.compact()
+    pipeline.retrieve_ids("attention")
+    assert pipeline.vector_store.queries == ["attention", "attention"]
+    assert pipeline.metrics.count("speculative_hits") == 0
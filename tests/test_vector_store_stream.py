@@ -0,0 +1,93 @@
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("langchain_community")
+pytest.importorskip("sentence_transformers")
+
+import src.vector_store as vector_store
+from src.chunk_store import ChunkStore
+from tests.fakes import FakeEmbeddings
+
+
+@pytest.fixture
+def make_manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "get_embeddings", lambda model_name: FakeEmbeddings())
+
+    def make(name="stream-test", max_chunks=0):
+        return vector_store.VectorStoreManager(name, max_chunks=max_chunks, chunk_size=200, chunk_overlap=40,
+                                               persist_directory=str(tmp_path / "chroma"))
+    return make
+
+
+def _pages(count, ocr=()):
+    for number in range(1, count + 1):
+        text = " ".join(f"page{number} word{i} lorem ipsum." for i in range(40))
+        stats = None
+        if number in ocr:
+            stats = {"ocr_seconds": 0.5, "ocr_confidence": 90.0, "ocr_dpi": 300, "ocr_cached": False}
+        yield number, text, stats
+
+
+def _stored_chunks(manager, source):
+    store = manager.chunk_store
+    return [store.text(store.lookup(source, i)) for i in range(store.count_source(source))]
+
+
+def test_stream_matches_whole_document(make_manager):
+    manager = make_manager()
+    text = "".join(page_text + "\n" for _, page_text, _ in _pages(12))
+    expected = manager.add_document("whole.pdf", text)
+
+    batches = []
+    added, reason = manager.add_document_stream("streamed.pdf", _pages(12), batch_chunks=4, on_batch=batches.append)
+
+    assert reason is None
+    assert added == expected
+    assert len(batches) > 1 and batches[-1] == added
+    assert _stored_chunks(manager, "streamed.pdf") == _stored_chunks(manager, "whole.pdf")
+    assert manager.vector_db._collection.count() == 2 * expected
+
+
+def test_stream_replaces_previous_version(make_manager):
+    manager = make_manager()
+    manager.add_document_stream("doc.pdf", _pages(6), batch_chunks=4)
+    added, _ = manager.add_document_stream("doc.pdf", _pages(3), batch_chunks=4)
+
+    assert manager.chunk_store.count_source("doc.pdf") == added
+    assert len(manager.vector_db._collection.get(where={"source": "doc.pdf"}, include=[])["ids"]) == added
+
+
+def test_stream_tags_ocr_pages(make_manager):
+    manager = make_manager()
+    manager.add_document_stream("scan.pdf", _pages(6, ocr={2}), batch_chunks=4)
+
+    metadatas = manager.vector_db._collection.get(where={"source": "scan.pdf"}, include=["metadatas"])["metadatas"]
+    tagged = [m for m in metadatas if "ocr_pages" in m]
+    assert tagged and all("2" in m["ocr_pages"].split(",") for m in tagged)
+    assert len(tagged) < len(metadatas)
+
+
+def test_stream_index_is_flushed(make_manager):
+    manager = make_manager()
+    added, _ = manager.add_document_stream("doc.pdf", _pages(6), batch_chunks=4)
+
+    assert ChunkStore(manager.chunk_store.directory).count_source("doc.pdf") == added
+
+
+def test_stream_trims_first_batch_to_quota(make_manager):
+    manager = make_manager(max_chunks=3)
+    added, reason = manager.add_document_stream("doc.pdf", _pages(6), batch_chunks=8)
+
+    assert added == 3
+    assert "quota" in reason
+    assert len(manager.chunk_store) == 3
+
+
+def test_stream_without_room_changes_nothing(make_manager):
+    manager = make_manager(max_chunks=3)
+    manager.add_document_stream("full.pdf", _pages(6), batch_chunks=8)
+
+    with pytest.raises(ValueError):
+        manager.add_document_stream("other.pdf", _pages(2), batch_chunks=8)
+    assert manager.chunk_store.sources() == ["full.pdf"]
+    assert len(manager.chunk_store) == 3
@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("langchain_community")
+pytest.importorskip("sentence_transformers")
+
+import src.vector_store as vector_store
+import src.workspaces as workspaces
+from src.workspaces import WorkspaceRegistry, validate_workspace_name
+from tests.fakes import FakeEmbeddings
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "get_embeddings", lambda model_name: FakeEmbeddings())
+    for module in (vector_store, workspaces):
+        monkeypatch.setattr(module, "CHROMA_DB_DIR", str(tmp_path / "chroma"))
+        monkeypatch.setattr(module, "CHUNK_STORE_DIR", str(tmp_path / "chroma" / "chunk_store"))
+    return WorkspaceRegistry(max_open=1, max_chunks=0)
+
+
+@pytest.mark.parametrize("name", ["space-422c60d1830ec6b7", "eval-0123456789abcdef", "a", "bad..name", "-x-"])
+def test_invalid_workspace_names(name):
+    with pytest.raises(ValueError):
+        validate_workspace_name(name)
+
+
+def test_open_returns_the_manager_still_in_use(registry):
+    alpha = registry.open("alpha")
+    registry.open("beta")  # unpins alpha
+    assert registry.open("alpha") is alpha
+
+
+def test_delete_then_recreate(registry):
+    old = registry.open("alpha")
+    old.add_document("a.pdf", "some text " * 50)
+    registry.delete("alpha")
+
+    # A session still holding the deleted manager can no longer write
+    with pytest.raises(ValueError):
+        old.add_document("b.pdf", "more text " * 50)
+
+    fresh = registry.open("alpha")
+    assert fresh is not old
+    assert fresh.chunk_store is not old.chunk_store
+    assert len(fresh.chunk_store) == 0
+    assert fresh.add_document("c.pdf", "new text " * 50) > 0
+    assert fresh.chunk_store.sources() == ["c.pdf"]